@@ -6,31 +6,47 @@ import sys
 import traceback
 import atexit
 import signal
-from flask import Flask, render_template, request, send_file, jsonify
+import json
+import redis
+from flask import Flask, Request, render_template, request, send_file, send_from_directory, jsonify, Response
 from werkzeug.utils import secure_filename
 from celery.result import AsyncResult
-from tasks import celery_app , MODELS_BASE_DIR
-
-def list_available_models_flask():
-    if not os.path.isdir(MODELS_BASE_DIR):
-        print(f"[Flask App] Warning: Models directory not found at {MODELS_BASE_DIR}")
-        return []
-    try: return sorted([f for f in os.listdir(MODELS_BASE_DIR) if f.lower().endswith('.onnx')])
-    except OSError as e:
-        print(f"[Flask App] Error listing models directory: {e}")
-        return []
-
-AVAILABLE_MODELS = list_available_models_flask()
-print(f"[Flask] Found {len(AVAILABLE_MODELS)} available Piper models.")
+from tasks import celery_app , MODELS_BASE_DIR, PAGE_CACHE_FOLDER, CHUNK_CACHE_FOLDER
+import hls
+import audio_files
+import job_store
+import uploads
+import scheduling
+import metrics
+import storage
+from audio_encoder import OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT, normalize_bitrate
+from model_registry import ModelRegistry
+
+model_registry = ModelRegistry(MODELS_BASE_DIR) # Rescanned on use, so new voices appear without a restart
+model_registry.refresh()
+
+class UploadRequest(Request):
+    # Multipart file parts are written straight to the upload folder and validated as they arrive
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None): return uploads.StreamedUpload(app.config['UPLOAD_FOLDER'])
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 
 # Defining constants and paths
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['AUDIO_FOLDER'] = os.path.join('static', 'audio')
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['AUDIO_FOLDER'], exist_ok=True)
+app.config['MAX_CONTENT_LENGTH'] = uploads.MAX_UPLOAD_BYTES + 1024**2 # Headroom for multipart framing and form fields
 REDIS_SERVER_PATH = r"Redis-7.4.3\redis-server.exe"
+# Audio serving: 'flask' sends the bytes itself (Range/206, ETag, Last-Modified); 'x-accel' (nginx) and
+# 'x-sendfile' (Apache/lighttpd) only send headers and let the front proxy serve the file
+AUDIO_SEND_MODE = 'flask'
+AUDIO_ACCEL_PREFIX = '/protected-audio/' # nginx location marked 'internal' and aliased to static/audio/
+AUDIO_CACHE_MAX_AGE = 24 * 3600 # Files never change once written (names are task ids)
+app.config['USE_X_SENDFILE'] = AUDIO_SEND_MODE == 'x-sendfile'
+# One worker per job class so short uploads never wait behind long books (see scheduling.py)
+WORKER_QUEUES = [('short', scheduling.SHORT_QUEUE, 2, ''), ('long', scheduling.LONG_QUEUE, 2, '')] # (name, queue, threads, voices to preload: comma-separated or '*')
 background_processes = []
 
 def cleanup_background_processes():
@@ -65,61 +81,212 @@ signal.signal(signal.SIGINT, signal_handler)
 def index(): return render_template('index.html')
 
 @app.route('/models')
-def get_models(): return jsonify(AVAILABLE_MODELS)
+def get_models(): return jsonify(model_registry.names())
+
+@app.route('/models/info')
+def get_models_info():
+    # Registry metadata plus the workers that currently have each voice loaded
+    try: workers = job_store.get_workers()
+    except redis.RedisError as e:
+        print(f"[Flask] Could not read worker heartbeats: {e}")
+        workers = {}
+    models = [dict(info, warm_on=sorted(host for host, worker in workers.items() if info['name'] in worker.get('warm_models', ()))) for info in model_registry.describe()]
+    return jsonify({"models": models, "workers": workers})
+
+@app.errorhandler(413)
+def upload_too_large(e): return jsonify({"status": "error", "message": f"File is larger than the {uploads.MAX_UPLOAD_BYTES // 1024**2} MB limit."}), 413
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    # Starts a resumable upload; the client then PATCHes chunks and passes upload_id to /convert
+    data = request.get_json(silent=True) or {}
+    filename, size = str(data.get('filename') or ''), data.get('size')
+    if not filename.lower().endswith('.pdf'): return jsonify({"status": "error", "message": "Invalid file (must be a PDF)."}), 400
+    if not isinstance(size, int): return jsonify({"status": "error", "message": "Missing file size."}), 400
+    try: upload_id = uploads.create_resumable_upload(app.config['UPLOAD_FOLDER'], filename, size)
+    except uploads.UploadRejected as e: return jsonify({"status": "error", "message": str(e)}), e.status_code
+    print(f"[Flask] Started resumable upload {upload_id} for '{filename}' ({size} bytes).")
+    return jsonify({"upload_id": upload_id, "offset": 0, "size": size, "chunk_size": uploads.RESUMABLE_CHUNK_BYTES}), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET', 'PATCH', 'DELETE'])
+def resumable_upload(upload_id):
+    folder = app.config['UPLOAD_FOLDER']
+    try:
+        if request.method == 'DELETE':
+            uploads.cancel_resumable_upload(folder, upload_id)
+            return jsonify({"upload_id": upload_id, "status": "cancelled"})
+        if request.method == 'PATCH':
+            if (request.content_length or 0) > uploads.RESUMABLE_CHUNK_BYTES: return jsonify({"status": "error", "message": f"Chunks are limited to {uploads.RESUMABLE_CHUNK_BYTES} bytes."}), 413
+            offset = request.headers.get('Upload-Offset', '')
+            if not offset.isdigit(): return jsonify({"status": "error", "message": "Missing Upload-Offset header."}), 400
+            uploads.append_resumable_chunk(folder, upload_id, int(offset), request.stream)
+        info = uploads.get_resumable_upload(folder, upload_id)
+    except uploads.UploadRejected as e:
+        response = {"status": "error", "message": str(e)}
+        if e.status_code == 409: response['offset'] = uploads.get_resumable_upload(folder, upload_id)['offset']
+        return jsonify(response), e.status_code
+    return jsonify({"upload_id": upload_id, "offset": info['offset'], "size": info['size'], "complete": info['complete']})
 
 @app.route('/convert', methods=['POST'])
 def start_conversion_job():
 
-    if 'pdf_file' not in request.files: return jsonify({"status": "error", "message": "No file part."}), 400
-    file = request.files['pdf_file']
-    original_filename = file.filename
-    selected_model = request.form.get('selected_model')
+    try: files, form = request.files, request.form # Parsing streams the PDF to disk, validating as it goes
+    except uploads.UploadRejected as e:
+        print(f"[Flask] Rejected upload: {e}")
+        return jsonify({"status": "error", "message": str(e)}), e.status_code
+
+    upload_id = form.get('upload_id')
+    if upload_id:
+        try: original_filename = uploads.get_resumable_upload(app.config['UPLOAD_FOLDER'], upload_id)['filename']
+        except uploads.UploadRejected as e: return jsonify({"status": "error", "message": str(e)}), e.status_code
+    elif 'pdf_file' in files: original_filename = files['pdf_file'].filename
+    else: return jsonify({"status": "error", "message": "No file part."}), 400
+    selected_model = form.get('selected_model')
+    output_format = form.get('output_format') or DEFAULT_OUTPUT_FORMAT
+    bitrate = form.get('bitrate') or None
+    split_chapters = form.get('split_chapters', '').lower() in ('1', 'true', 'on', 'yes')
+    previous_task_id = form.get('previous_task_id') or None
 
     if original_filename == '' or not original_filename.lower().endswith('.pdf'): return jsonify({"status": "error", "message": "Invalid file (must be a PDF)."}), 400
     if not selected_model: return jsonify({"status": "error", "message": "No TTS model selected."}), 400
-    if selected_model not in AVAILABLE_MODELS: print(f"[Flask] Warning: Client requested model '{selected_model}' which is not in the known list: {AVAILABLE_MODELS}")
+    if output_format not in OUTPUT_FORMATS: return jsonify({"status": "error", "message": f"Unsupported output format (choose one of: {', '.join(OUTPUT_FORMATS)})."}), 400
+    if bitrate and not normalize_bitrate(bitrate): return jsonify({"status": "error", "message": "Invalid bitrate."}), 400
+    if previous_task_id and (secure_filename(previous_task_id) != previous_task_id or not os.path.exists(audio_files.manifest_path(app.config['AUDIO_FOLDER'], previous_task_id))):
+        return jsonify({"status": "error", "message": "The previous conversion to revise was not found (it may have expired)."}), 400
+    model_info = model_registry.get(selected_model)
+    if not model_info: return jsonify({"status": "error", "message": "Unknown TTS model."}), 400
+
+    client_id = get_client_id()
+    try:
+        active_jobs = count_active_jobs(client_id)
+        if active_jobs >= scheduling.MAX_ACTIVE_JOBS_PER_USER:
+            print(f"[Flask] Rejecting upload from {client_id}: {active_jobs} active jobs.")
+            return jsonify({"status": "error", "message": f"You already have {active_jobs} conversions in progress. Please wait for one to finish."}), 429
+    except Exception as e: print(f"[Flask] Warning: Per-user job limit unavailable ({e}), accepting upload.")
 
     pdf_path = None
+    task_id = None
+    dedup_key = None
 
     try:
         secured_filename = secure_filename(original_filename)
-        unique_id = str(uuid.uuid4())
-        pdf_filename_internal = f"{unique_id}_{secured_filename}"
+        task_id = str(uuid.uuid4())
+        pdf_filename_internal = f"{task_id}_{secured_filename}"
         pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], pdf_filename_internal)
-        file.save(pdf_path)
-        print(f"[Flask] Received '{original_filename}'. Saved: {pdf_path}")
-        print(f"[Flask] Selected Model: {selected_model}")
+        try:
+            if upload_id: pdf_hash, pdf_size = uploads.finish_resumable_upload(app.config['UPLOAD_FOLDER'], upload_id, pdf_path)
+            else: pdf_hash, pdf_size = files['pdf_file'].stream.keep(pdf_path)
+        except uploads.UploadRejected as e:
+            print(f"[Flask] Rejected upload '{original_filename}': {e}")
+            return jsonify({"status": "error", "message": str(e)}), e.status_code
+        print(f"[Flask] Received '{original_filename}' ({pdf_size} bytes). Saved: {pdf_path}")
+        print(f"[Flask] Selected Model: {selected_model}, Output: {output_format} {bitrate or 'default bitrate'}{', one file per chapter' if split_chapters else ''}{f', revising {previous_task_id}' if previous_task_id else ''}")
+
+        try: estimate = scheduling.estimate_job(pdf_path, pdf_size)
+        except Exception as e:
+            print(f"[Flask] Could not read uploaded PDF '{original_filename}': {e}")
+            uploads.remove_quietly(pdf_path)
+            return jsonify({"status": "error", "message": "Invalid file (could not read PDF)."}), 400
+
+        dedup_key = job_store.make_dedup_key(pdf_hash, selected_model, output_format, normalize_bitrate(bitrate), split_chapters, model_info['version'])
+        existing_task_id = claim_existing_conversion(dedup_key, task_id)
+        if existing_task_id:
+            dedup_key = None # Owned by the existing task
+            uploads.remove_quietly(pdf_path)
+            print(f"[Flask] Identical conversion already exists. Reusing Task ID: {existing_task_id}")
+            return jsonify({"status": "queued", "task_id": existing_task_id, "deduplicated": True, "message": "Identical conversion already submitted." })
+
+        try:
+            job_store.set_job_fields(task_id, submitted_at=time.time(), client_id=client_id, **estimate)
+            job_store.add_user_job(client_id, task_id)
+        except Exception as e: print(f"[Flask] Warning: Could not record job {task_id} ({e}).")
+
+        queue = estimate['queue']
+        try: queue = scheduling.warm_queue(queue, selected_model, job_store.get_workers()) # A worker with the voice preloaded, if any
+        except redis.RedisError as e: print(f"[Flask] Warning: Could not read worker heartbeats ({e}), using queue '{queue}'.")
 
         from tasks import task_convert_pdf
-        task = task_convert_pdf.delay(pdf_path, original_filename, selected_model)
-        print(f"[Flask] Sent task to Celery queue. Task ID: {task.id}")
+        task = task_convert_pdf.apply_async(args=(pdf_path, original_filename, selected_model), kwargs={'output_format': output_format, 'bitrate': bitrate, 'queue': queue, 'split_chapters': split_chapters, 'previous_task_id': previous_task_id}, task_id=task_id, queue=queue, priority=estimate['priority'])
+        print(f"[Flask] Sent task to Celery queue '{queue}' (priority {estimate['priority']}, {estimate['pages']} pages). Task ID: {task.id}")
 
-        return jsonify({"status": "queued", "task_id": task.id, "message": "Conversion task submitted." })
+        return jsonify({"status": "queued", "task_id": task.id, "message": "Conversion task submitted.", "estimate": describe_estimate(estimate) })
 
     except Exception as e:
         print(f"[Flask] Error in /convert for '{original_filename}': {e}")
         print(traceback.format_exc())
-        
-        if pdf_path and os.path.exists(pdf_path):
-             try: os.remove(pdf_path)
-             except OSError: pass
-
+        uploads.remove_quietly(pdf_path)
+        if dedup_key:
+            try: job_store.release_claim(dedup_key, task_id) # Otherwise identical uploads would get an id that was never queued
+            except redis.RedisError as release_error: print(f"[Flask] Warning: Could not release dedup claim: {release_error}")
+        if task_id:
+            try: # Never queued, so it must not hold one of the user's active job slots
+                job_store.remove_user_jobs(client_id, [task_id])
+                job_store.set_job_fields(task_id, finished_at=time.time(), final_state='FAILURE')
+            except redis.RedisError as release_error: print(f"[Flask] Warning: Could not release job {task_id}: {release_error}")
         return jsonify({"status": "error", "message": f"Server error processing request."}), 500
 
-@app.route('/status/<task_id>')
-def get_task_status(task_id):
-    task_result = AsyncResult(task_id, app=celery_app)
-    response = {'task_id': task_id, 'status': task_result.state, 'info': None, 'message': '' }
-    state = task_result.state
-    info = task_result.info
-    print(f"[Flask] Status check for Task: {task_id}")
+def get_client_id(): return request.remote_addr or 'anonymous'
+
+def job_finished(job_id):
+    # Workers record finished_at in job_store; Celery's result meta expires sooner, after which it reads PENDING
+    fields = job_store.get_job_fields(job_id)
+    if not fields or fields.get('finished_at'): return True # A job whose record expired is long over
+    if job_stalled(fields): return True # Lost with its worker: its Celery state will never become final
+    return celery_app.backend.get_task_meta(job_id).get('status') in FINAL_STATES # e.g. revoked before it started
+
+def job_stalled(fields):
+    last_seen = max(float(fields.get(field) or 0) for field in ('submitted_at', 'started_at', 'updated_at'))
+    limit = scheduling.ACTIVE_JOB_STALL_SECONDS if fields.get('started_at') else scheduling.QUEUED_JOB_STALL_SECONDS
+    return time.time() - last_seen > limit
+
+def count_active_jobs(client_id):
+    # Finished jobs are dropped from the user's set lazily, here, instead of by every task exit path
+    job_ids = job_store.get_user_jobs(client_id)
+    finished = [job_id for job_id in job_ids if job_finished(job_id)]
+    if finished: job_store.remove_user_jobs(client_id, finished)
+    return len(job_ids) - len(finished)
+
+def describe_estimate(fields): return {'pages': int(fields['pages']), 'file_size_bytes': int(fields['file_size_bytes']), 'estimated_seconds': int(fields['estimated_seconds']), 'job_class': fields['job_class']}
+
+def claim_existing_conversion(dedup_key, task_id):
+    # Returns the id of a queued, running or finished task for the same PDF/model/format/bitrate, or None
+    # once task_id owns the conversion. Dedup is an optimization: if Redis is unavailable, convert anyway.
+    try:
+        existing_task_id = job_store.claim_conversion(dedup_key, task_id)
+        if existing_task_id:
+            meta = celery_app.backend.get_task_meta(existing_task_id)
+            state, info = meta.get('status'), meta.get('result')
+            output_missing = state == 'SUCCESS' and not (isinstance(info, dict) and info.get('audio_filename') and os.path.exists(os.path.join(app.config['AUDIO_FOLDER'], info['audio_filename'])))
+            # PENDING is also what an unknown or expired id reads as: only trust it for a job still waiting to finish
+            stale_pending = state == 'PENDING' and not pending_job_alive(existing_task_id)
+            if state not in ('FAILURE', 'REVOKED') and not output_missing and not stale_pending: return existing_task_id
+            print(f"[Flask] Previous conversion {existing_task_id} is unusable ({state}), starting a new one.")
+            job_store.replace_claim(dedup_key, task_id)
+        job_store.set_job_fields(task_id, dedup_key=dedup_key, submitted_at=time.time()) # Marks the claim as a live job right away
+    except Exception as e: print(f"[Flask] Warning: Deduplication unavailable ({e}), converting without it.")
+    return None
+
+def pending_job_alive(job_id):
+    fields = job_store.get_job_fields(job_id)
+    if not fields.get('submitted_at') or fields.get('finished_at'): return False
+    return not os.path.exists(os.path.join(app.config['AUDIO_FOLDER'], f"{job_id}.json")) # The sidecar is written on success
+
+FINAL_STATES = ('SUCCESS', 'FAILURE', 'REVOKED')
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_SECONDS = 3600
+
+def build_status_response(task_id, state, info):
+    response = {'task_id': task_id, 'status': state, 'info': None, 'message': '' }
+
+    stream_dir = os.path.join(app.config['AUDIO_FOLDER'], secure_filename(task_id))
+    if hls.stream_available(stream_dir): response['stream_url'] = f"/stream/{task_id}/{hls.PLAYLIST_NAME}"
 
     if state == 'PENDING': response['message'] = 'Waiting in queue...'
     elif state == 'PROGRESS':
         response['message'] = 'Processing...'
         response['info'] = info
     elif state == 'SUCCESS':
-        result = task_result.result
+        result = info
         response['message'] = result.get('message', 'Completed.') if isinstance(result, dict) else 'Completed.'
         response['info'] = result
         
@@ -127,7 +294,7 @@ def get_task_status(task_id):
             audio_filename = result.get('audio_filename')
             
             if audio_filename: 
-                response['audio_url'] = f"/static/audio/{audio_filename}"
+                response['audio_url'] = f"/audio/{audio_filename}"
                 response['download_url'] = f"/download/{audio_filename}"
             else:
                 response['status'] = 'FAILURE'
@@ -151,37 +318,111 @@ def get_task_status(task_id):
 
     else: response['message'] = f'State: {state}'
 
-    print(f"[Flask] Task {task_id} -> Status: {response['status']} Message: {response['message']}")
-    return jsonify(response)
+    return response
 
+def fetch_task_status(task_id):
+    # One backend round-trip (AsyncResult.state and .info would each fetch the meta)
+    meta = celery_app.backend.get_task_meta(task_id)
+    response = build_status_response(task_id, meta.get('status', 'PENDING'), meta.get('result'))
+    add_schedule_info(response, task_id)
+    return response
 
-@app.route('/download/<filename>')
-def download_file(filename):
+def add_schedule_info(response, task_id):
+    # Cost estimate and queue wait recorded by /convert and the worker; absent for jobs submitted without Redis
+    try: fields = job_store.get_job_fields(task_id)
+    except Exception: return
+    if 'submitted_at' not in fields or 'queue' not in fields: return # e.g. only the dedup claim was recorded
+    started_at = float(fields['started_at']) if 'started_at' in fields else None
+    response['estimate'] = describe_estimate(fields)
+    response['queue'] = {'name': fields['queue'], 'priority': int(fields['priority']), 'waiting': started_at is None, 'wait_seconds': round((started_at or time.time()) - float(fields['submitted_at']), 1)}
+
+@app.route('/status/<task_id>')
+def get_task_status(task_id): return jsonify(fetch_task_status(task_id))
+
+@app.route('/events/<task_id>')
+def stream_task_events(task_id):
+    try: pubsub = job_store.subscribe_progress(task_id) # Subscribe before reading the current state so no event is missed
+    except Exception as e:
+        print(f"[Flask] Progress events unavailable for {task_id}: {e}")
+        return jsonify({"status": "error", "message": "Progress events unavailable, use /status."}), 503
+
+    def sse(payload): return f"data: {json.dumps(payload, default=str)}\n\n"
+
+    def generate():
+        try:
+            current = fetch_task_status(task_id)
+            yield sse(current)
+            if current['status'] in FINAL_STATES: return
+
+            opened_at = time.time()
+            while time.time() - opened_at < SSE_MAX_SECONDS:
+                message = pubsub.get_message(timeout=SSE_HEARTBEAT_SECONDS)
+                if message is None:
+                    # Quiet period: re-check the stored state in case an event was lost, then keep the connection alive
+                    current = fetch_task_status(task_id)
+                    if current['status'] in FINAL_STATES:
+                        yield sse(current)
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+
+                event = json.loads(message['data'])
+                current = build_status_response(task_id, event.get('status'), event.get('info'))
+                yield sse(current)
+                if current['status'] in FINAL_STATES: return
+        finally: pubsub.close()
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/stream/<task_id>/playlist.m3u8')
+def get_stream_playlist(task_id):
+    if secure_filename(task_id) != task_id: return jsonify({"status": "error", "message": "Invalid task id."}), 400
+    stream_dir = os.path.join(app.config['AUDIO_FOLDER'], task_id)
+    if not hls.stream_available(stream_dir): return jsonify({"status": "error", "message": "Stream not available yet."}), 404
+
+    response = Response(hls.build_playlist(stream_dir), mimetype='application/vnd.apple.mpegurl')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/stream/<task_id>/<segment>')
+def get_stream_segment(task_id, segment):
+    if secure_filename(task_id) != task_id or secure_filename(segment) != segment or not segment.endswith('.ts'): return jsonify({"status": "error", "message": "Invalid segment."}), 400
+    # Segments are immutable once listed in the playlist
+    return send_from_directory(os.path.join(app.config['AUDIO_FOLDER'], task_id), segment, mimetype='video/mp2t', max_age=86400)
+
+def send_audio(filename, as_attachment):
     safe_filename = secure_filename(filename)
 
-    if safe_filename != filename or not safe_filename.endswith('.mp3'): return jsonify({"status": "error", "message": "Invalid filename."}), 400
+    extension = os.path.splitext(safe_filename)[1].lstrip('.')
+    output_spec = next((spec for spec in OUTPUT_FORMATS.values() if spec['extension'] == extension), None)
+
+    if safe_filename != filename or not output_spec: return jsonify({"status": "error", "message": "Invalid filename."}), 400
     file_path = os.path.join(app.config['AUDIO_FOLDER'], safe_filename)
     if os.path.exists(file_path):
-        task_id = filename.split('.')[0]
-        download_name_hint = "audiobook"
-        orig_fn=None
-        print(f"[Flask] Serving download: {file_path}")
+        storage.mark_accessed(file_path) # Keeps listened-to books ahead of the janitor's LRU eviction
+        metadata = audio_files.read_sidecar(file_path)
+        orig_fn = metadata.get('original_filename')
+        title = metadata.get('title') or (os.path.splitext(orig_fn)[0] if orig_fn else None) # Chapter files carry their own title
+        download_name_hint = secure_filename(title) if title else "audiobook"
+        download_name = f"{download_name_hint or 'audiobook'}.{extension}"
+
+        if AUDIO_SEND_MODE == 'x-accel':
+            response = Response(mimetype=output_spec['mimetype'])
+            response.headers['X-Accel-Redirect'] = AUDIO_ACCEL_PREFIX + safe_filename
+            response.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline', filename=download_name)
+            response.headers['Cache-Control'] = f"public, max-age={AUDIO_CACHE_MAX_AGE}"
+            return response
+
+        # send_file answers Range requests with 206 and conditional requests with 304
+        response = send_file(os.path.abspath(file_path), mimetype=output_spec['mimetype'], as_attachment=as_attachment, download_name=download_name, conditional=True, etag=True, max_age=AUDIO_CACHE_MAX_AGE)
+        response.headers['Accept-Ranges'] = 'bytes' # Advertised on full responses too, so players know they can seek
+        return response
 
-        try:
-            task_result = AsyncResult(task_id, app=celery_app)
-            if task_result.state == 'SUCCESS' and isinstance(task_result.result, dict):
-                 orig_fn = task_result.result.get('original_filename')
-                 if orig_fn: download_name_hint = os.path.splitext(secure_filename(orig_fn))[0]
-        except Exception: pass
-
-        download_name = f"{download_name_hint}.mp3"
-        return send_file(file_path, as_attachment=True, download_name=download_name)
-    
     else:
         task_id = filename.split('.')[0]
         task_result = AsyncResult(task_id, app=celery_app)
         state = task_result.state
-        print(f"[Flask] Download 404 for: {safe_filename}. Task state: {state}")
+        print(f"[Flask] Audio 404 for: {safe_filename}. Task state: {state}")
         message = "Audio file not found."
 
         if state == 'SUCCESS': message += " Conversion completed but file not found."
@@ -190,6 +431,25 @@ def download_file(filename):
 
         return jsonify({"status": "error", "message": message}), 404
 
+@app.route('/audio/<filename>')
+def play_audio(filename): return send_audio(filename, as_attachment=False)
+
+@app.route('/download/<filename>')
+def download_file(filename):
+    print(f"[Flask] Serving download: {filename}")
+    return send_audio(filename, as_attachment=True)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # Histograms are aggregated in Redis by the workers, so any web process can serve the full picture
+    try:
+        voice_queues = {queue for worker in job_store.get_workers().values() for queue in worker.get('queues', ()) if queue not in (scheduling.SHORT_QUEUE, scheduling.LONG_QUEUE)}
+        body = metrics.render_prometheus([scheduling.SHORT_QUEUE, scheduling.LONG_QUEUE] + sorted(voice_queues), storage.last_report)
+    except redis.RedisError as e:
+        print(f"[Flask] Metrics unavailable: {e}")
+        return Response("# metrics backend unavailable\n", status=503, mimetype='text/plain')
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     print("--- PDF to Audio Converter ---")
 
@@ -218,35 +478,42 @@ if __name__ == '__main__':
         sys.exit(1)
 
     # --- Celery
-    celery_log_file = 'logs/celery-worker.log'
-    os.makedirs(os.path.dirname(celery_log_file), exist_ok=True)
-    print(f"Attempting to start Celery worker...")
-    print(f"Output will be redirected to: {celery_log_file}")
-
-    try:
-        celery_command = [sys.executable, "-m", "celery", "-A", "tasks", "worker", "--loglevel=info", "-P", "threads" ]
-        print(f"Worker command: {' '.join(celery_command)}")
-        with open(celery_log_file, 'wb') as clog:
-             creationflags = subprocess.CREATE_NO_WINDOW
-             celery_proc = subprocess.Popen(celery_command, stdout=clog, stderr=subprocess.STDOUT, creationflags=creationflags )
-        print(f"Celery worker process started (PID: {celery_proc.pid}). Waiting briefly...")
-
-        background_processes.append((celery_proc, "Celery Worker"))
-        time.sleep(5)
-        
-        if celery_proc.poll() is not None: raise RuntimeError(f"Celery worker failed to stay running. Check {celery_log_file}")
+    for worker_name, worker_queue, worker_threads, worker_preload in WORKER_QUEUES:
+        celery_log_file = f'logs/celery-worker-{worker_name}.log'
+        os.makedirs(os.path.dirname(celery_log_file), exist_ok=True)
+        print(f"Attempting to start Celery worker '{worker_name}' (queue {worker_queue})...")
+        print(f"Output will be redirected to: {celery_log_file}")
 
-    except Exception as e:
-        print(f"[ERROR] Failed to start Celery worker: {e}")
-        print("Attempting to clean up Redis...")
-        cleanup_background_processes()
-        sys.exit(1)
+        try:
+            celery_command = [sys.executable, "-m", "celery", "-A", "tasks", "worker", "--loglevel=info", "-P", "threads", "-c", str(worker_threads), "-Q", worker_queue, "-n", f"{worker_name}@%h" ]
+            print(f"Worker command: {' '.join(celery_command)}")
+            with open(celery_log_file, 'wb') as clog:
+                 creationflags = subprocess.CREATE_NO_WINDOW
+                 worker_env = dict(os.environ, AUDIOFY_PRELOAD_MODELS=worker_preload) if worker_preload else None
+                 celery_proc = subprocess.Popen(celery_command, stdout=clog, stderr=subprocess.STDOUT, creationflags=creationflags, env=worker_env )
+            print(f"Celery worker process started (PID: {celery_proc.pid}). Waiting briefly...")
+
+            background_processes.append((celery_proc, f"Celery Worker ({worker_name})"))
+            time.sleep(5)
+
+            if celery_proc.poll() is not None: raise RuntimeError(f"Celery worker failed to stay running. Check {celery_log_file}")
+
+        except Exception as e:
+            print(f"[ERROR] Failed to start Celery worker: {e}")
+            print("Attempting to clean up Redis...")
+            cleanup_background_processes()
+            sys.exit(1)
+
+    # Storage janitor: quotas for uploads, scratch and finished audio (see storage.py)
+    janitor = storage.Janitor(app.config['UPLOAD_FOLDER'], app.config['AUDIO_FOLDER'], PAGE_CACHE_FOLDER, CHUNK_CACHE_FOLDER, resumable_folder_name=uploads.RESUMABLE_FOLDER_NAME)
+    janitor.start()
+    print(f"Storage janitor started (every {storage.JANITOR_INTERVAL_SECONDS}s, scratch in {storage.SCRATCH_ROOT}).")
 
     # Flask App
     print("-----------------------------------")
     print("Starting Flask application...")
     print("!!! Background process cleanup on exit is best-effort on Windows !!!")
-    print(f"--- Found Models: {len(AVAILABLE_MODELS)} ---")
+    print(f"--- Found Models: {len(model_registry.names())} ---")
     print("-----------------------------------")
     
     app.run(debug=False, host='127.0.0.1', port=5000, threaded=True)
\ No newline at end of file
@@ -0,0 +1,102 @@
+import os
+import uuid
+import shutil
+import hashlib
+import threading
+import unicodedata
+from model_registry import model_signature
+
+def normalize_chunk_text(text): return ' '.join(unicodedata.normalize('NFC', text).split())
+
+def link_or_copy(src_path, dest_path):
+    try: os.link(src_path, dest_path)
+    except OSError: shutil.copyfile(src_path, dest_path)
+
+class ChunkAudioCache:
+    # Disk-backed store of per-chunk WAVs keyed by (model and config file hash, normalized text), LRU-evicted by mtime.
+    # Entries are hardlinked to and from job scratch WAVs where the filesystem allows, so the budget counts each
+    # entry's full size even though a running job shares those bytes; evicting a shared entry (link count > 1)
+    # frees nothing until its job removes its scratch, so unshared entries are evicted first.
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._model_digests = {}
+        self._approx_bytes = None
+
+    def model_digest(self, model_path):
+        # Covers the .onnx.json config too: its length_scale, noise and speaker settings change the audio
+        signature = model_signature(model_path)
+        if signature[0] is None: raise FileNotFoundError(f"Model not found: {model_path}")
+        memo_key = (os.path.abspath(model_path), signature)
+        digest = self._model_digests.get(memo_key)
+        if digest is None:
+            sha = hashlib.sha256()
+            for path in (model_path, model_path + '.json') if signature[1] else (model_path,):
+                with open(path, 'rb') as model:
+                    for block in iter(lambda: model.read(1024 * 1024), b''): sha.update(block)
+            digest = self._model_digests[memo_key] = sha.hexdigest()
+        return digest
+
+    def make_key(self, model_path, text):
+        sha = hashlib.sha256(self.model_digest(model_path).encode('ascii'))
+        sha.update(b'\0')
+        sha.update(normalize_chunk_text(text).encode('utf-8'))
+        return sha.hexdigest()
+
+    def _entry_path(self, key): return os.path.join(self.root, key[:2], f"{key}.wav")
+
+    def get(self, key, dest_path):
+        # Returns the cached size in bytes on a hit (dest_path now holds the audio), None on a miss
+        entry_path = self._entry_path(key)
+        try:
+            os.utime(entry_path) # Bump recency for LRU eviction
+            link_or_copy(entry_path, dest_path)
+            return os.path.getsize(dest_path)
+        except OSError: return None
+
+    def put(self, key, src_path):
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        tmp_path = f"{entry_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            link_or_copy(src_path, tmp_path)
+            try: replaced = os.path.getsize(entry_path) # Same chunk stored again, e.g. by two jobs at once
+            except OSError: replaced = 0
+            os.replace(tmp_path, entry_path) # Atomic: readers never see a partial entry
+        except OSError as e:
+            print(f"[ChunkCache] Warning: Failed to store {key[:12]}: {e}")
+            try: os.remove(tmp_path)
+            except OSError: pass
+            return
+
+        with self._lock:
+            if self._approx_bytes is None: self._approx_bytes = self._scan()[1]
+            else: self._approx_bytes += os.path.getsize(entry_path) - replaced
+            if self._approx_bytes > self.max_bytes: self._evict_locked()
+
+    def _scan(self):
+        entries, total = [], 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try: stat = os.stat(path)
+                except OSError: continue
+                entries.append((stat.st_nlink > 1, stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        return entries, total
+
+    def _evict_locked(self):
+        # Trim to 90% of the budget so every put near the limit doesn't trigger a full scan
+        entries, total = self._scan()
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for _, _, size, path in sorted(entries): # Unshared entries first, then least recently used
+            if total <= target: break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError: pass
+        self._approx_bytes = total
+        print(f"[ChunkCache] Evicted {removed} entries, {total} bytes remain (budget {self.max_bytes}).")
@@ -0,0 +1,119 @@
+import os
+import struct
+import threading
+import subprocess
+from collections import deque
+
+PCM_BLOCK_BYTES = 256 * 1024
+
+# 'chapters': the container can carry chapter markers (MP4 family); other formats only list them in the result
+OUTPUT_FORMATS = {
+    'mp3': {'extension': 'mp3', 'codec': 'libmp3lame', 'bitrate': '192k', 'mimetype': 'audio/mpeg', 'args': [], 'chapters': False},
+    'opus': {'extension': 'opus', 'codec': 'libopus', 'bitrate': '48k', 'mimetype': 'audio/ogg', 'args': ['-application', 'voip'], 'chapters': False},
+    'aac': {'extension': 'm4a', 'codec': 'aac', 'bitrate': '96k', 'mimetype': 'audio/mp4', 'args': ['-movflags', '+faststart'], 'chapters': True},
+    'm4b': {'extension': 'm4b', 'codec': 'aac', 'bitrate': '64k', 'mimetype': 'audio/mp4', 'args': ['-f', 'ipod', '-movflags', '+faststart'], 'chapters': True},
+}
+DEFAULT_OUTPUT_FORMAT = 'mp3'
+MIN_BITRATE_KBPS = 16
+MAX_BITRATE_KBPS = 320
+
+def normalize_bitrate(bitrate):
+    # Accepts '64k' / '64' / 64; returns an FFmpeg bitrate string or None when invalid
+    if bitrate is None or bitrate == '': return None
+    value = str(bitrate).strip().lower().rstrip('k')
+    if not value.isdigit() or not MIN_BITRATE_KBPS <= int(value) <= MAX_BITRATE_KBPS: return None
+    return f"{int(value)}k"
+
+def output_extension(output_format): return OUTPUT_FORMATS[output_format]['extension']
+
+def read_wav_header(f):
+    # Parses a RIFF/WAVE header and leaves f positioned at the start of the PCM data.
+    # Returns (channels, sample_width, frame_rate, data_size).
+    riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+    if riff != b'RIFF' or wave_id != b'WAVE': raise RuntimeError("Not a RIFF/WAVE file.")
+    fmt = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8: raise RuntimeError("WAV file has no data chunk.")
+        chunk_id, chunk_size = struct.unpack('<4sI', header)
+        if chunk_id == b'fmt ':
+            body = f.read(chunk_size + (chunk_size & 1))
+            audio_format, channels, frame_rate, _, _, bits = struct.unpack('<HHIIHH', body[:16])
+            if audio_format not in (1, 0xFFFE): raise RuntimeError(f"Unsupported WAV encoding (format tag {audio_format}).")
+            fmt = (channels, bits // 8, frame_rate)
+        elif chunk_id == b'data':
+            if fmt is None: raise RuntimeError("WAV data chunk appears before its fmt chunk.")
+            # Writers that stream their output may leave a placeholder size; trust the file length instead
+            remaining = os.fstat(f.fileno()).st_size - f.tell()
+            return fmt + (min(chunk_size, remaining),)
+        else: f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+def wav_duration_seconds(wav_path):
+    with open(wav_path, 'rb') as wav: channels, sample_width, frame_rate, data_size = read_wav_header(wav)
+    return data_size / (channels * sample_width * frame_rate)
+
+class PcmStreamEncoder:
+    # A single long-running ffmpeg process fed raw PCM on stdin; started lazily from the first WAV's format
+    def __init__(self, ffmpeg_path, output_path, output_format=DEFAULT_OUTPUT_FORMAT, bitrate=None):
+        if output_format not in OUTPUT_FORMATS: raise ValueError(f"Unsupported output format '{output_format}'.")
+        self.ffmpeg_path = ffmpeg_path
+        self.output_path = output_path
+        self.output_format = output_format
+        self.bitrate = normalize_bitrate(bitrate) or OUTPUT_FORMATS[output_format]['bitrate']
+        self.proc = None
+        self.audio_params = None
+        self.frames_written = 0
+        self._buffer = memoryview(bytearray(PCM_BLOCK_BYTES))
+        self._stderr_tail = deque(maxlen=40)
+
+    def _start(self, channels, sample_width, frame_rate):
+        if sample_width != 2: raise RuntimeError(f"Unsupported WAV sample width {sample_width} bytes (expected 16-bit PCM).")
+        spec = OUTPUT_FORMATS[self.output_format]
+        command = [ self.ffmpeg_path, '-y', '-f', 's16le', '-ar', str(frame_rate), '-ac', str(channels), '-i', 'pipe:0', '-vn', '-c:a', spec['codec'], '-b:a', self.bitrate ] + spec['args'] + [ self.output_path ]
+        print(f"[Encoder] Starting FFmpeg stream encode: {' '.join(command)}")
+        try: self.proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        except FileNotFoundError: raise RuntimeError(f"FFmpeg command '{self.ffmpeg_path}' not found.")
+        threading.Thread(target=self._pump_stderr, daemon=True).start()
+        self.audio_params = (channels, sample_width, frame_rate)
+
+    def _pump_stderr(self):
+        for raw in self.proc.stderr: self._stderr_tail.append(raw.decode('utf-8', errors='replace').rstrip())
+
+    def stderr_tail(self, max_chars=1000): return '\n'.join(self._stderr_tail)[-max_chars:]
+
+    @property
+    def duration_seconds(self): return self.frames_written / self.audio_params[2] if self.audio_params else 0.0
+
+    def write_wav(self, wav_path):
+        # Copies the chunk's PCM data into FFmpeg's stdin through one reused buffer, no per-block allocations
+        with open(wav_path, 'rb') as wav:
+            channels, sample_width, frame_rate, data_size = read_wav_header(wav)
+            params = (channels, sample_width, frame_rate)
+            if self.proc is None: self._start(*params)
+            elif params != self.audio_params: raise RuntimeError(f"Chunk {os.path.basename(wav_path)} has audio format {params}, expected {self.audio_params}.")
+
+            remaining = data_size - data_size % (channels * sample_width)
+            while remaining > 0:
+                n = wav.readinto(self._buffer[:min(remaining, PCM_BLOCK_BYTES)])
+                if not n: break
+                try: self.proc.stdin.write(self._buffer[:n])
+                except (BrokenPipeError, OSError):
+                    self.proc.wait()
+                    raise RuntimeError(f"FFmpeg encoder exited early (Code {self.proc.returncode}). Error: {self.stderr_tail()[:200]}...")
+                remaining -= n
+                self.frames_written += n // (channels * sample_width)
+
+    def close(self):
+        if self.proc is None: raise RuntimeError("No audio was written to the encoder.")
+        try: self.proc.stdin.close()
+        except OSError: pass
+        self.proc.wait()
+        if self.proc.returncode != 0:
+            print(f"[Encoder] FFmpeg Error Output:\n{self.stderr_tail()}")
+            raise RuntimeError(f"FFmpeg failed final {self.output_format.upper()} encoding (Code {self.proc.returncode}). Error: {self.stderr_tail()[:200]}...")
+        if not os.path.exists(self.output_path) or os.path.getsize(self.output_path) == 0: raise RuntimeError("FFmpeg produced an empty or missing output file.")
+
+    def abort(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
@@ -0,0 +1,42 @@
+import os
+import json
+import uuid
+
+# Each finished audiobook <task_id>.<ext> gets a <task_id>.json sidecar describing it, so serving a
+# download never needs a result-backend lookup. Per-chapter files get one too, with their own title.
+SIDECAR_FIELDS = ('original_filename', 'title', 'selected_model', 'output_format', 'bitrate', 'audio_duration_seconds', 'audio_filesize_bytes', 'chapters')
+
+def sidecar_path(audio_path): return os.path.splitext(audio_path)[0] + '.json'
+
+def write_json_atomic(path, data):
+    # Readers only ever see a complete file; a failed write leaves no temp file behind (shared with hls.py)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(data, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+def _write_metadata(path, data, description):
+    try: write_json_atomic(path, data)
+    except OSError as e: print(f"[Audio] Warning: Failed to write {description}: {e}")
+
+def write_sidecar(audio_path, result): _write_metadata(sidecar_path(audio_path), {k: result.get(k) for k in SIDECAR_FIELDS}, f"metadata for {os.path.basename(audio_path)}")
+
+def read_sidecar(audio_path):
+    try:
+        with open(sidecar_path(audio_path), encoding='utf-8') as f: return json.load(f)
+    except (OSError, ValueError): return {}
+
+# Chunk manifest of a finished job (<task_id>.manifest.json): lets a revised upload of the same document
+# reuse the chunking, and so the cached chunk audio, of this job (see text_chunker.plan_revision)
+def manifest_path(folder, task_id): return os.path.join(folder, f"{task_id}.manifest.json")
+
+def write_manifest(folder, task_id, manifest): _write_metadata(manifest_path(folder, task_id), manifest, f"chunk manifest for {task_id}")
+
+def read_manifest(folder, task_id):
+    try:
+        with open(manifest_path(folder, task_id), encoding='utf-8') as f: return json.load(f)
+    except (OSError, ValueError): return None
@@ -0,0 +1,93 @@
+# Chunking: the previous fixed-size splitter vs the sentence-aware planner, on generated text.
+# Reports split time (should grow linearly), chunk balance, sentences cut mid-way and the simulated
+# synthesis makespan when chunks are handed out in order to N workers.
+# Usage: python benchmarks/bench_chunker.py [--chars 30000 200000 1000000 5000000] [--workers 8]
+import os
+import re
+import sys
+import time
+import heapq
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from text_chunker import iter_sentences, plan_chunks, estimate_cost
+
+WORDS = "the voice model reads each page aloud while workers share the queue and nothing waits too long for audio".split()
+ABBREVIATED = ["Dr. Smith", "Mr. Jones", "e.g. this", "approx. 40", "Fig. 3", "the U.S. court", "J. R. Tolkien", "3.14 units"]
+
+def legacy_chunks(text, chunk_size=2500):
+    # The fixed-size splitter this replaces: cut at the last '.' past half the size, else the last space
+    chunks = []
+    current_pos = 0
+    while current_pos < len(text):
+        end_pos = min(current_pos + chunk_size, len(text))
+        sentence_end = text.rfind('.', current_pos, end_pos + 1)
+        if sentence_end > current_pos + (chunk_size // 2): end_pos = sentence_end + 1
+        elif end_pos < len(text):
+            space_pos = text.rfind(' ', current_pos, end_pos)
+            if space_pos > current_pos + (chunk_size // 3): end_pos = space_pos + 1
+        chunks.append(text[current_pos:end_pos].strip())
+        current_pos = end_pos
+    return [chunk for chunk in chunks if chunk]
+
+def make_pages(num_chars, seed=7):
+    rng = random.Random(seed)
+    pages, page, total = [], [], 0
+    while total < num_chars:
+        words = [rng.choice(WORDS) for _ in range(rng.choice([4, 8, 15, 30, 60]))]
+        if rng.random() < 0.3: words.insert(rng.randrange(len(words)), rng.choice(ABBREVIATED))
+        if rng.random() < 0.1: words.append(str(rng.randrange(10**6)))
+        sentence = ' '.join(words).capitalize() + rng.choice('..?!')
+        page.append(sentence)
+        total += len(sentence) + 1
+        if sum(len(s) + 1 for s in page) > 3000:
+            pages.append((len(pages), ' '.join(page) + "\n"))
+            page = []
+    if page: pages.append((len(pages), ' '.join(page) + "\n"))
+    return pages
+
+def makespan(costs, workers):
+    free_at = [0.0] * workers
+    for cost in costs: heapq.heappush(free_at, heapq.heappop(free_at) + cost)
+    return max(free_at)
+
+def report(name, seconds, texts, chunk_ends, sentence_ends, workers):
+    costs = [estimate_cost(text, max(1, len(re.findall(r'[.!?](?:\s|$)', text)))) for text in texts]
+    mean = sum(costs) / len(costs)
+    # A chunk boundary that isn't a boundary from the segmenter cut a sentence (or split an abbreviation)
+    cut = sum(1 for end in chunk_ends[:-1] if end not in sentence_ends)
+    span = makespan(costs, workers)
+    print(f"  {name:8} {seconds * 1000:8.1f}ms  {len(texts):5} chunks  max/mean cost {max(costs) / mean:5.2f}  cut mid-sentence {cut:4}  makespan {span / (sum(costs) / workers):5.2f}x ideal")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chars', type=int, nargs='+', default=[30000, 200000, 1000000, 5000000])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--chunks-per-worker', type=int, default=3)
+    args = parser.parse_args()
+
+    for num_chars in args.chars:
+        pages = make_pages(num_chars)
+        text = ''.join(page_text for _, page_text in pages)
+        sentence_end_offsets = {end for _, _, end, _, _ in iter_sentences(pages)}
+
+        start = time.perf_counter()
+        legacy = legacy_chunks(text)
+        legacy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        planned = plan_chunks(pages, target_chunks=args.workers * args.chunks_per_worker)
+        planned_seconds = time.perf_counter() - start
+
+        legacy_ends, offset = [], 0
+        for chunk in legacy:
+            offset = text.index(chunk, offset) + len(chunk)
+            legacy_ends.append(offset)
+
+        print(f"{len(text)} chars, {len(pages)} pages, {args.workers} workers")
+        report('legacy', legacy_seconds, legacy, legacy_ends, sentence_end_offsets, args.workers)
+        report('planned', planned_seconds, [chunk['text'] for chunk in planned], [chunk['char_end'] for chunk in planned], sentence_end_offsets, args.workers)
+        print(f"  planned  {num_chars / planned_seconds / 1e6:8.2f}M chars/s")
+
+if __name__ == '__main__': main()
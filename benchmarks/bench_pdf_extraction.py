@@ -0,0 +1,46 @@
+# Page extraction throughput: serial vs process pool vs page-text cache, on generated PDFs.
+# Usage: python benchmarks/bench_pdf_extraction.py [--pages 200 500] [--workers 4]
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pdf_extraction import PdfTextExtractor, PageTextCache, shutdown_executor
+from pdf_fixtures import make_text_pdf
+
+def run(pdf_path, **kwargs):
+    extractor = PdfTextExtractor(pdf_path, **kwargs)
+    start = time.perf_counter()
+    chars = sum(len(text) for _, text in extractor)
+    return time.perf_counter() - start, chars, extractor
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, nargs='+', default=[200, 500])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for num_pages in args.pages:
+            pdf_path = make_text_pdf(os.path.join(work_dir, f"bench_{num_pages}.pdf"), num_pages)
+            cache = PageTextCache(os.path.join(work_dir, f"cache_{num_pages}"))
+
+            serial, chars, serial_extractor = run(pdf_path, max_workers=1)
+            parallel, _, extractor = run(pdf_path, max_workers=args.workers, parallel_min_pages=1)
+            run(pdf_path, cache=cache, max_workers=args.workers, parallel_min_pages=1) # Warm the cache
+            cached, _, _ = run(pdf_path, cache=cache, max_workers=args.workers)
+
+            slowest = ', '.join(f"p{i + 1}={s * 1000:.1f}ms" for i, s in extractor.slowest_pages())
+            print(f"{num_pages} pages, {chars} chars, {args.workers} worker(s)")
+            print(f"  serial        {serial:7.2f}s  {num_pages / serial:8.0f} pages/s")
+            print(f"  process pool  {parallel:7.2f}s  {num_pages / parallel:8.0f} pages/s  x{serial / parallel:.1f}")
+            print(f"  cached        {cached:7.2f}s  {num_pages / cached:8.0f} pages/s  x{serial / cached:.1f}")
+            print(f"  slowest pages: {slowest}")
+            # Page timings include opening the PDF reader (charged to the first page each reader extracts)
+            print(f"  page timings total: serial {sum(s for _, s in serial_extractor.page_timings):.2f}s, process pool {sum(s for _, s in extractor.page_timings):.2f}s")
+    shutdown_executor()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+# End-to-end conversion throughput: runs task_convert_pdf eagerly (no broker, no Redis) on generated PDFs,
+# with the stub Piper and stub FFmpeg, and reports jobs/hour, time to first audio, peak RSS and peak
+# scratch disk use per PDF size and pipeline mode.
+# Each case runs in a fresh process so peak RSS and caches don't leak between cases. Eager mode runs the
+# chunk tasks of a fan-out job one after another, so its numbers are per worker process.
+# Usage: python benchmarks/bench_pipeline.py [--pages 10 50 200] [--modes fanout stream] [--rtf 0.05] [--json out.json]
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+from pdf_fixtures import make_text_pdf
+
+MODEL_NAME = 'bench-voice.onnx'
+RESULT_MARKER = 'BENCH_RESULT '
+SAMPLE_INTERVAL = 0.05
+
+def dir_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try: total += os.path.getsize(os.path.join(root, name))
+            except OSError: pass # Removed while walking
+    return total
+
+def peak_rss_bytes():
+    # (this process, largest finished child); None where the resource module is missing (Windows)
+    try: import resource
+    except ImportError: return None, None
+    scale = 1 if sys.platform == 'darwin' else 1024 # ru_maxrss is bytes on macOS, KiB elsewhere
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+
+def write_ffmpeg_launcher(work_dir):
+    # The app runs FFMPEG_PATH as a single executable, so wrap the stub script in one
+    stub = os.path.join(BENCH_DIR, 'stub_ffmpeg.py')
+    if os.name == 'nt':
+        path = os.path.join(work_dir, 'ffmpeg.cmd')
+        with open(path, 'w') as f: f.write(f'@"{sys.executable}" "{stub}" %*\n')
+    else:
+        path = os.path.join(work_dir, 'ffmpeg')
+        with open(path, 'w') as f: f.write(f'#!/bin/sh\nexec "{sys.executable}" "{stub}" "$@"\n')
+        os.chmod(path, 0o755)
+    return path
+
+def use_in_process_job_store(job_store, metrics):
+    # Everything runs in this process, so job bookkeeping can live in dicts instead of Redis
+    fields = {}
+    def set_job_fields(job_id, **values): fields.setdefault(job_id, {}).update({k: v for k, v in values.items() if v is not None})
+    def mark_chunk_done(job_id):
+        job = fields.setdefault(job_id, {})
+        job['chunks_done'] = job.get('chunks_done', 0) + 1
+        return job['chunks_done'], job.get('chunks_total', 0)
+    job_store.set_job_fields = set_job_fields
+    job_store.get_job_field = lambda job_id, field: fields.get(job_id, {}).get(field)
+    job_store.init_job_progress = lambda job_id, num_chunks: set_job_fields(job_id, chunks_total=num_chunks, chunks_done=0)
+    job_store.mark_chunk_done = mark_chunk_done
+    job_store.publish_progress = lambda job_id, state, info: None
+    job_store.register_completed_output = lambda dedup_key, task_id, size_bytes: []
+    metrics.observe_many = lambda name, values, labels=None: None
+    metrics.increment = lambda name, labels=None, amount=1: None
+
+def run_case(case_dir, pdf_path, mode, output_format, ffmpeg_path):
+    # Child process: the app uses paths relative to the working directory, so import it from the case dir
+    os.chdir(case_dir)
+    import tasks
+    import metrics
+    import job_store
+    tasks.celery_app.conf.update(task_always_eager=True, task_eager_propagates=True, result_backend='cache+memory://')
+    tasks.engine_pool.piper_command = [sys.executable, os.path.join(BENCH_DIR, 'stub_piper.py')]
+    tasks.FFMPEG_PATH = ffmpeg_path
+    tasks.JOB_SCRATCH_FOLDER = os.path.join(case_dir, 'scratch')
+    use_in_process_job_store(job_store, metrics)
+
+    first_audio = []
+    publish_stream_chunk = tasks.publish_stream_chunk
+    def timed_publish(job_id, chunk_index, wav_path):
+        # Playback can start once the first chunk is published
+        publish_stream_chunk(job_id, chunk_index, wav_path)
+        if chunk_index == 0 and not first_audio: first_audio.append(time.perf_counter())
+    tasks.publish_stream_chunk = timed_publish
+
+    peak_scratch = [0]
+    stop = threading.Event()
+    def sample_scratch():
+        while not stop.wait(SAMPLE_INTERVAL): peak_scratch[0] = max(peak_scratch[0], dir_bytes(tasks.JOB_SCRATCH_FOLDER))
+    sampler = threading.Thread(target=sample_scratch, daemon=True)
+    sampler.start()
+
+    start = time.perf_counter()
+    try: job = tasks.task_convert_pdf.apply(args=(pdf_path, os.path.basename(pdf_path), MODEL_NAME), kwargs={'pipeline_mode': mode, 'output_format': output_format})
+    finally:
+        elapsed = time.perf_counter() - start
+        stop.set()
+        sampler.join()
+        tasks.shutdown_engine_pool() # Reaps Piper and the extraction pool so they count as finished children
+
+    result = job.get()
+    rss, child_rss = peak_rss_bytes()
+    output_bytes = os.path.getsize(os.path.join(tasks.AUDIO_FOLDER, result['audio_filename'])) + dir_bytes(tasks.get_job_stream_dir(job.id))
+    return {'mode': mode, 'chunks': result['num_chunks_processed'], 'audio_seconds': result['audio_duration_seconds'], 'wall_seconds': round(elapsed, 3), 'jobs_per_hour': round(3600 / elapsed, 1), 'first_audio_seconds': round(first_audio[0] - start, 3) if first_audio else None, 'timings': result.get('timings'), 'peak_rss_bytes': rss, 'peak_child_rss_bytes': child_rss, 'peak_scratch_bytes': peak_scratch[0], 'output_bytes': output_bytes}
+
+def spawn_case(args, work_dir, ffmpeg_path, mode, num_pages):
+    case_dir = os.path.join(work_dir, f"{mode}_{num_pages}")
+    os.makedirs(os.path.join(case_dir, 'models'))
+    with open(os.path.join(case_dir, 'models', MODEL_NAME), 'wb') as model: model.write(b'\0' * 1024)
+    pdf_path = make_text_pdf(os.path.join(case_dir, f"book_{num_pages}.pdf"), num_pages, seed=num_pages)
+
+    env = dict(os.environ, STUB_PIPER_RTF=str(args.rtf), STUB_PIPER_LOAD_SECONDS=str(args.load_seconds), STUB_FFMPEG_SPEED=str(args.ffmpeg_speed))
+    command = [sys.executable, os.path.abspath(__file__), '--run-case', case_dir, pdf_path, mode, args.format, ffmpeg_path]
+    proc = subprocess.run(command, capture_output=True, text=True, encoding='utf-8', errors='replace', env=env)
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_MARKER): return dict(json.loads(line[len(RESULT_MARKER):]), pages=num_pages)
+    raise RuntimeError(f"{mode}/{num_pages} pages failed (exit {proc.returncode}):\n{(proc.stdout + proc.stderr)[-2000:]}")
+
+def megabytes(value): return f"{value / 1024**2:8.1f}" if value is not None else f"{'-':>8}"
+
+def seconds(value): return f"{value:8.2f}" if value is not None else f"{'-':>8}"
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--run-case':
+        print(RESULT_MARKER + json.dumps(run_case(*sys.argv[2:7])), flush=True)
+        return
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--modes', nargs='+', choices=['fanout', 'stream'], default=['fanout', 'stream'])
+    parser.add_argument('--format', default='mp3')
+    parser.add_argument('--rtf', type=float, default=0.0, help='Simulated Piper seconds per second of audio (0 = instant)')
+    parser.add_argument('--load-seconds', type=float, default=0.25, help='Simulated Piper model load time')
+    parser.add_argument('--ffmpeg-speed', type=float, default=0.0, help='Simulated encode speed, times realtime (0 = instant)')
+    parser.add_argument('--json', help='Also write the results to this file, for comparing runs')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        ffmpeg_path = write_ffmpeg_launcher(work_dir)
+        for num_pages in args.pages:
+            for mode in args.modes: results.append(spawn_case(args, work_dir, ffmpeg_path, mode, num_pages))
+
+    print(f"{args.format}, stub Piper rtf {args.rtf} (load {args.load_seconds:.2f}s), stub FFmpeg speed {args.ffmpeg_speed or 'instant'}")
+    print(f"{'mode':<7} {'pages':>5} {'chunks':>6} {'audio m':>8} {'wall s':>8} {'jobs/h':>8} {'1st aud':>8} {'extract':>8} {'synth':>8} {'encode':>8} {'RSS MB':>8} {'child MB':>8} {'tmp MB':>8} {'out MB':>8}")
+    for r in results:
+        timings = r['timings'] or {}
+        print(f"{r['mode']:<7} {r['pages']:>5} {r['chunks']:>6} {r['audio_seconds'] / 60:8.1f} {r['wall_seconds']:8.2f} {r['jobs_per_hour']:8.0f} {seconds(r['first_audio_seconds'])} {seconds(timings.get('extract_seconds'))} {seconds(timings.get('synthesis_seconds'))} {seconds(timings.get('encode_seconds'))} {megabytes(r['peak_rss_bytes'])} {megabytes(r['peak_child_rss_bytes'])} {megabytes(r['peak_scratch_bytes'])} {megabytes(r['output_bytes'])}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f: json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
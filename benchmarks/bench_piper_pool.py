@@ -0,0 +1,82 @@
+# Compares one Piper process per chunk (the old task_convert_pdf behaviour) against the pooled engine, then
+# runs the chunks of one voice from several task threads, as a worker started with -c N does, with one engine
+# per voice against one engine per thread.
+# Usage: python benchmarks/bench_piper_pool.py [--chunks 40] [--load-seconds 0.25] [--rtf 0.002] [--threads 2]
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from piper_pool import PiperEnginePool
+
+STUB_PIPER = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_piper.py')]
+WORDS = "the of and a to in is was that for it with as his on be at by had are but from or have an they which one you were all her she there would their we him been has when who will no more if out so said what up its about than into them can only other time new some could these two may first then do any like my now over such our man me even most made after also did many before must through back years where much your way well down should because each just those people how too little state good very make world still see own men work long here get both between life being under never day same another know while last might us great old year off come since against go came right used take three".split()
+
+def build_corpus(num_chunks, chunk_chars, seed=1234):
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(num_chunks):
+        sentences, length = [], 0
+        while length < chunk_chars:
+            sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 24))).capitalize() + '.'
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        chunks.append(' '.join(sentences)[:chunk_chars])
+    return chunks
+
+def run_per_chunk_spawn(model_path, chunks, work_dir):
+    for i, chunk in enumerate(chunks):
+        output_path = os.path.join(work_dir, f"spawn_{i}.wav")
+        result = subprocess.run(STUB_PIPER + ['--model', model_path, '--output_file', output_path], input=chunk, capture_output=True, text=True, encoding='utf-8')
+        if result.returncode != 0: raise RuntimeError(result.stderr)
+
+def run_pooled(model_path, chunks, work_dir):
+    pool = PiperEnginePool(STUB_PIPER, max_engines=1)
+    try:
+        for i, chunk in enumerate(chunks): pool.synthesize(model_path, chunk, os.path.join(work_dir, f"pool_{i}.wav"))
+    finally: pool.shutdown()
+
+def run_pooled_threads(model_path, chunks, work_dir, threads, engines_per_model):
+    pool = PiperEnginePool(STUB_PIPER, max_engines=threads, max_engines_per_model=engines_per_model)
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(lambda i: pool.synthesize(model_path, chunks[i], os.path.join(work_dir, f"threads_{engines_per_model}_{i}.wav")), range(len(chunks))))
+    finally: pool.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=40)
+    parser.add_argument('--chunk-chars', type=int, default=2500)
+    parser.add_argument('--load-seconds', type=float, default=0.25, help='Simulated model load time per process start')
+    parser.add_argument('--rtf', type=float, default=0.002, help='Simulated Piper seconds per second of audio')
+    parser.add_argument('--threads', type=int, default=2, help='Task threads sharing one pool, all on the same voice')
+    args = parser.parse_args()
+    os.environ['STUB_PIPER_LOAD_SECONDS'] = str(args.load_seconds)
+    os.environ['STUB_PIPER_RTF'] = str(args.rtf)
+
+    chunks = build_corpus(args.chunks, args.chunk_chars)
+    with tempfile.TemporaryDirectory() as work_dir:
+        model_path = os.path.join(work_dir, 'stub-voice.onnx')
+        with open(model_path, 'wb') as model: model.write(b'\0' * 1024)
+
+        results = []
+        runners = [('per-chunk spawn', run_per_chunk_spawn), ('pooled engine', run_pooled),
+                   (f"{args.threads} thr, 1 engine", lambda *a: run_pooled_threads(*a, args.threads, 1)),
+                   (f"{args.threads} thr, {args.threads} engines", lambda *a: run_pooled_threads(*a, args.threads, args.threads))]
+        for name, runner in runners:
+            start = time.perf_counter()
+            runner(model_path, chunks, work_dir)
+            results.append((name, time.perf_counter() - start))
+
+    print(f"{len(chunks)} chunks x {args.chunk_chars} chars, simulated model load {args.load_seconds:.2f}s, rtf {args.rtf}")
+    baseline = results[0][1]
+    for name, elapsed in results:
+        print(f"  {name:<20} {elapsed:8.2f}s  {elapsed / len(chunks) * 1000:8.1f} ms/chunk  x{baseline / elapsed:.1f}")
+
+if __name__ == '__main__':
+    main()
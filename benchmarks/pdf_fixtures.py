@@ -0,0 +1,56 @@
+# Generates text PDFs of arbitrary size without extra dependencies (one Helvetica text block per page).
+import random
+
+WORDS = "the of and a to in is was that for it with as his on be at by had are but from or have an they which one you were all her she there would their we him been has when who will no more if out so said what up its about than into them can only other time new some could these two may first then do any like my now over such our man me even most made after also did many before must through back years where much your way well down should because each just those people how too little state good very make world still see own men work long here get both between life being under never day same another know while last might".split()
+
+def _escape(text): return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def make_text_pdf(path, num_pages, lines_per_page=48, words_per_line=12, seed=1234, page_texts=None, outline=None):
+    # page_texts: optional list of per-page strings (overrides generated text; one line per '\n')
+    # outline: optional list of (title, page_index) bookmarks
+    rng = random.Random(seed)
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")
+    page_ids = []
+
+    for page_index in range(num_pages):
+        if page_texts is not None: lines = page_texts[page_index].split('\n')
+        else: lines = [' '.join(rng.choice(WORDS) for _ in range(words_per_line)).capitalize() + '.' for _ in range(lines_per_page)]
+        content = ("BT /F1 10 Tf 14 TL 50 760 Td " + ' '.join(f"({_escape(line)}) Tj T*" for line in lines) + " ET").encode('latin-1', errors='replace')
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        page_ids.append(add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R /Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, content_id, font_id)))
+
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b' '.join(b"%d 0 R" % i for i in page_ids), len(page_ids))
+
+    catalog_extra = b""
+    if outline:
+        outlines_id = add(b"")
+        item_ids = list(range(len(objects) + 1, len(objects) + 1 + len(outline)))
+        for n, (title, page_index) in enumerate(outline):
+            links = b""
+            if n > 0: links += b" /Prev %d 0 R" % item_ids[n - 1]
+            if n < len(outline) - 1: links += b" /Next %d 0 R" % item_ids[n + 1]
+            add(b"<< /Title (%s) /Parent %d 0 R /Dest [%d 0 R /Fit]%s >>" % (_escape(title).encode('latin-1', errors='replace'), outlines_id, page_ids[page_index], links))
+        objects[outlines_id - 1] = b"<< /Type /Outlines /First %d 0 R /Last %d 0 R /Count %d >>" % (item_ids[0], item_ids[-1], len(outline))
+        catalog_extra = b" /Outlines %d 0 R /PageMode /UseOutlines" % outlines_id
+
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R%s >>" % (pages_id, catalog_extra))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b''.join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref_offset)
+
+    with open(path, 'wb') as f: f.write(out)
+    return path
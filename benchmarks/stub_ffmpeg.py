@@ -0,0 +1,65 @@
+# Deterministic stand-in for the FFmpeg CLI, used by the benchmarks.
+# Handles the ways the app drives FFmpeg: the stream encode (raw PCM on pipe:0, see audio_encoder.py),
+# HLS segmenting of a chunk WAV (see hls.py) and the chapter-marker remux (see chapters.py). Encoded
+# outputs are filler bytes sized from the requested bitrate, so disk usage matches a real encode while
+# costing almost no CPU.
+import os
+import sys
+import time
+import wave
+import shutil
+
+SPEED = float(os.environ.get('STUB_FFMPEG_SPEED', '0')) # Times realtime; 0 means no simulated encode time
+READ_BLOCK_BYTES = 256 * 1024
+
+def option(args, name, default=None): return args[args.index(name) + 1] if name in args else default
+
+def bitrate_bytes_per_second(value):
+    value = (value or '128k').lower()
+    return int(float(value[:-1]) * 1000 / 8) if value.endswith('k') else int(value) // 8
+
+def write_filler(path, num_bytes):
+    with open(path, 'wb') as f:
+        while num_bytes > 0:
+            n = min(num_bytes, READ_BLOCK_BYTES)
+            f.write(b'\0' * n)
+            num_bytes -= n
+
+def encode_pcm_stream(args):
+    # -f s16le -ar <rate> -ac <channels> -i pipe:0 ... <output>
+    bytes_per_second = int(option(args, '-ar')) * int(option(args, '-ac')) * 2
+    pcm_bytes = 0
+    for block in iter(lambda: sys.stdin.buffer.read(READ_BLOCK_BYTES), b''): pcm_bytes += len(block)
+    seconds = pcm_bytes / bytes_per_second
+    if SPEED: time.sleep(seconds / SPEED)
+    write_filler(args[-1], max(1, int(seconds * bitrate_bytes_per_second(option(args, '-b:a')))))
+
+def segment_wav(args):
+    # -i <wav> ... -f segment -segment_time <s> -segment_list <csv> <pattern>
+    with wave.open(option(args, '-i')) as wav: seconds = wav.getnframes() / wav.getframerate()
+    if SPEED: time.sleep(seconds / SPEED)
+    segment_seconds = float(option(args, '-segment_time'))
+    rate = bitrate_bytes_per_second(option(args, '-b:a'))
+    rows = []
+    start = 0.0
+    index = 0
+    while start < seconds or index == 0:
+        end = min(start + segment_seconds, seconds)
+        name = args[-1] % index
+        write_filler(name, max(1, int((end - start) * rate)))
+        rows.append(f"{os.path.basename(name)},{start:.3f},{end:.3f}")
+        start, index = end, index + 1
+    with open(option(args, '-segment_list'), 'w', encoding='utf-8') as f: f.write('\n'.join(rows) + '\n')
+
+def main():
+    args = sys.argv[1:]
+    if option(args, '-i') == 'pipe:0': encode_pcm_stream(args)
+    elif option(args, '-f') == 'segment': segment_wav(args)
+    elif '-map_chapters' in args: shutil.copyfile(option(args, '-i'), args[-1]) # Stream copy: same audio
+    else:
+        print(f"stub ffmpeg: unsupported command: {' '.join(args)}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+# Deterministic stand-in for the Piper CLI, used by the benchmarks.
+# Supports the two ways tasks.py drives Piper: one process per chunk (--output_file, text on stdin)
+# and a long-lived engine (--json-input, one JSON request per line, output path echoed on stdout).
+import os
+import sys
+import json
+import math
+import time
+import wave
+import argparse
+
+LOAD_SECONDS = float(os.environ.get('STUB_PIPER_LOAD_SECONDS', '0.25'))
+CHARS_PER_SECOND = float(os.environ.get('STUB_PIPER_CHARS_PER_SECOND', '15'))
+REALTIME_FACTOR = float(os.environ.get('STUB_PIPER_RTF', '0.0'))
+SAMPLE_RATE = int(os.environ.get('STUB_PIPER_SAMPLE_RATE', '22050'))
+
+def write_wav(text, output_path):
+    audio_seconds = max(len(text) / CHARS_PER_SECOND, 0.1)
+    if REALTIME_FACTOR: time.sleep(audio_seconds * REALTIME_FACTOR)
+    frames = int(audio_seconds * SAMPLE_RATE)
+    # Quiet 220 Hz tone; one period is repeated so generation stays cheap for long chunks
+    period = SAMPLE_RATE // 220
+    cycle = b''.join(int(800 * math.sin(2 * math.pi * i / period)).to_bytes(2, 'little', signed=True) for i in range(period))
+    pcm = (cycle * (frames // period + 1))[:frames * 2]
+    with wave.open(output_path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', '--model', required=True)
+    parser.add_argument('-f', '--output_file')
+    parser.add_argument('--output_dir', default='.')
+    parser.add_argument('--json-input', action='store_true')
+    args, _ = parser.parse_known_args()
+
+    if not os.path.exists(args.model):
+        print(f"Model not found: {args.model}", file=sys.stderr)
+        return 1
+    time.sleep(LOAD_SECONDS) # Simulated ONNX model load
+    print(f"[stub-piper] Loaded {args.model}", file=sys.stderr)
+
+    if not args.json_input:
+        write_wav(sys.stdin.read(), args.output_file)
+        return 0
+
+    for index, line in enumerate(sys.stdin):
+        line = line.strip()
+        if not line: continue
+        request = json.loads(line)
+        output_path = request.get('output_file') or os.path.join(args.output_dir, f"{index}.wav")
+        write_wav(request['text'], output_path)
+        print(output_path, flush=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,4 +2,12 @@
 broker_url = 'redis://localhost:6379/0'
 result_backend = 'redis://localhost:6379/1'
 task_serializer = 'json'; result_serializer = 'json'; accept_content = ['json']
-timezone = 'UTC'; enable_utc = True
\ No newline at end of file
+timezone = 'UTC'; enable_utc = True
+
+# Short/long job queues (see scheduling.py); anything not routed explicitly goes to the short queue
+task_default_queue = 'convert_short'
+# Priorities 0 (first) to 9 within each queue; prefetch one task at a time so priorities are honoured
+broker_transport_options = {'priority_steps': list(range(10)), 'sep': ':', 'queue_order_strategy': 'priority'}
+worker_prefetch_multiplier = 1
+# Results are read back for dedup and /status as long as job_store keeps the job (DEDUP_RESULT_TTL, JOB_KEY_TTL)
+result_expires = 7 * 24 * 3600
@@ -0,0 +1,82 @@
+import os
+import re
+import uuid
+import subprocess
+from PyPDF2 import PdfReader
+
+# Chapters come from the PDF outline (top-level bookmarks). Chunks never span a chapter start (see
+# text_chunker), so each chapter is a run of whole chunks and its timing falls out of the encode order.
+CHAPTER_TITLE_MAX_CHARS = 120
+_FFMETADATA_SPECIAL = re.compile(r'([=;#\\\n])')
+
+def read_pdf_outline(pdf_path):
+    # [(title, first_page_index)] of the top-level bookmarks, in page order; [] when there is no usable outline
+    entries = []
+    try:
+        with open(pdf_path, 'rb') as file:
+            reader = PdfReader(file)
+            for item in reader.outline:
+                if isinstance(item, list): continue # Nested bookmarks (sections) stay inside their chapter
+                try: page_index = reader.get_destination_page_number(item)
+                except Exception: continue
+                title = ' '.join(str(item.title or '').split())[:CHAPTER_TITLE_MAX_CHARS]
+                if page_index is not None and page_index >= 0: entries.append((title, page_index))
+    except Exception as e:
+        print(f"[Chapters] Warning: Could not read outline of {os.path.basename(pdf_path)}: {e}")
+        return []
+    entries.sort(key=lambda entry: entry[1])
+    return [(title, page) for n, (title, page) in enumerate(entries) if n == 0 or page != entries[n - 1][1]] # First bookmark per page
+
+def build_chapters(outline, front_matter_title):
+    # Chapter list covering the whole book: pages before the first bookmark become an extra first chapter
+    if not outline: return []
+    if outline[0][1] > 0: outline = [(front_matter_title, 0)] + list(outline)
+    return [{'index': i, 'title': title or f"Chapter {i + 1}", 'first_page': page} for i, (title, page) in enumerate(outline)]
+
+def chapter_starts(chapters): return [chapter['first_page'] for chapter in chapters]
+
+class ChapterTimeline:
+    # Fed each chunk's chapter in encode order together with the audio position the chunk starts at
+    def __init__(self, chapters):
+        self.chapters = chapters
+        self.starts = {}
+
+    def mark(self, chapter_index, position_seconds): self.starts.setdefault(chapter_index, position_seconds)
+
+    def finish(self, total_seconds):
+        # Chapters without any text (e.g. image-only pages) produced no audio and are left out
+        present = [chapter for chapter in self.chapters if chapter['index'] in self.starts]
+        timed = []
+        for chapter, following in zip(present, present[1:] + [None]):
+            start = self.starts[chapter['index']]
+            end = self.starts[following['index']] if following else total_seconds
+            timed.append(dict(chapter, start_seconds=round(start, 3), duration_seconds=round(end - start, 3)))
+        return timed
+
+def _ffmetadata_escape(value): return _FFMETADATA_SPECIAL.sub(r'\\\1', str(value))
+
+def write_ffmetadata(path, chapters, title=None):
+    lines = [';FFMETADATA1']
+    if title: lines.append(f"title={_ffmetadata_escape(title)}")
+    for chapter in chapters:
+        start_ms = int(chapter['start_seconds'] * 1000)
+        end_ms = int((chapter['start_seconds'] + chapter['duration_seconds']) * 1000)
+        lines += ['[CHAPTER]', 'TIMEBASE=1/1000', f"START={start_ms}", f"END={end_ms}", f"title={_ffmetadata_escape(chapter['title'])}"]
+    with open(path, 'w', encoding='utf-8') as f: f.write('\n'.join(lines) + '\n')
+
+def embed_chapter_markers(ffmpeg_path, audio_path, chapters, title=None, output_args=()):
+    # Stream-copy remux (no re-encode) that adds chapter markers; timings are only known once all audio is encoded
+    root, extension = os.path.splitext(audio_path)
+    token = uuid.uuid4().hex[:8]
+    metadata_path = f"{root}.{token}.ffmeta"
+    tmp_path = f"{root}.{token}.tmp{extension}"
+    try:
+        write_ffmetadata(metadata_path, chapters, title)
+        command = [ ffmpeg_path, '-y', '-i', audio_path, '-f', 'ffmetadata', '-i', metadata_path, '-map', '0:a', '-map_metadata', '1', '-map_chapters', '1', '-c', 'copy' ] + list(output_args) + [ tmp_path ]
+        result = subprocess.run(command, capture_output=True, text=True, check=False, creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        if result.returncode != 0: raise RuntimeError(f"FFmpeg failed to add chapter markers (Code {result.returncode}). Error: {result.stderr[-200:]}")
+        os.replace(tmp_path, audio_path)
+    finally:
+        for path in (metadata_path, tmp_path):
+            try: os.remove(path)
+            except OSError: pass
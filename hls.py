@@ -0,0 +1,76 @@
+import os
+import json
+import math
+import uuid
+import shutil
+import subprocess
+from audio_files import write_json_atomic
+
+# Progressive playback: every chunk is encoded into short MPEG-TS segments as soon as it is synthesized,
+# described by a per-chunk manifest. The playlist is built on request from the contiguous run of finished
+# chunks, so concurrent chunk workers never have to coordinate writes to a shared playlist file.
+SEGMENT_SECONDS = 10
+SEGMENT_BITRATE = '96k'
+PLAYLIST_NAME = 'playlist.m3u8'
+COMPLETE_MARKER = 'complete.json'
+
+def _manifest_path(stream_dir, chunk_index): return os.path.join(stream_dir, f"chunk_{chunk_index:05d}.json")
+
+def publish_chunk_segments(ffmpeg_path, wav_path, stream_dir, chunk_index, segment_seconds=SEGMENT_SECONDS):
+    # Encodes one chunk WAV into segments. Everything is written under a private temp dir first and moved
+    # into place with os.replace, so readers only ever see complete segments and manifests.
+    os.makedirs(stream_dir, exist_ok=True)
+    work_dir = os.path.join(stream_dir, f".tmp_{chunk_index:05d}_{uuid.uuid4().hex[:8]}")
+    os.makedirs(work_dir)
+
+    try:
+        segments = []
+        if wav_path:
+            segment_pattern = os.path.join(work_dir, f"seg_{chunk_index:05d}_%03d.ts")
+            segment_list = os.path.join(work_dir, 'segments.csv')
+            command = [ ffmpeg_path, '-y', '-i', wav_path, '-vn', '-c:a', 'aac', '-b:a', SEGMENT_BITRATE, '-f', 'segment', '-segment_time', str(segment_seconds), '-segment_format', 'mpegts', '-segment_list', segment_list, '-segment_list_type', 'csv', segment_pattern ]
+            result = subprocess.run(command, capture_output=True, text=True, check=False)
+            if result.returncode != 0: raise RuntimeError(f"FFmpeg failed to segment chunk {chunk_index + 1} (Code {result.returncode}). Error: {result.stderr[-200:]}")
+
+            with open(segment_list, encoding='utf-8') as f:
+                for line in f:
+                    parts = line.strip().split(',')
+                    if len(parts) < 3: continue
+                    name = os.path.basename(parts[0])
+                    os.replace(os.path.join(work_dir, name), os.path.join(stream_dir, name))
+                    segments.append({'file': name, 'duration': round(float(parts[2]) - float(parts[1]), 3)})
+
+        write_json_atomic(_manifest_path(stream_dir, chunk_index), {'chunk_index': chunk_index, 'segments': segments})
+        return segments
+
+    finally: shutil.rmtree(work_dir, ignore_errors=True)
+
+def mark_stream_complete(stream_dir, num_chunks):
+    if os.path.isdir(stream_dir): write_json_atomic(os.path.join(stream_dir, COMPLETE_MARKER), {'num_chunks': num_chunks})
+
+def stream_available(stream_dir): return os.path.exists(_manifest_path(stream_dir, 0))
+
+def build_playlist(stream_dir, segment_seconds=SEGMENT_SECONDS):
+    entries = []
+    chunk_index = 0
+    while True:
+        try:
+            with open(_manifest_path(stream_dir, chunk_index), encoding='utf-8') as f: manifest = json.load(f)
+        except (OSError, ValueError): break
+        # Each chunk was encoded on its own, so timestamps restart at every chunk boundary
+        if manifest['segments'] and entries: entries.append('#EXT-X-DISCONTINUITY')
+        for segment in manifest['segments']:
+            entries.append(f"#EXTINF:{segment['duration']:.3f},")
+            entries.append(segment['file'])
+        chunk_index += 1
+
+    complete = False
+    try:
+        with open(os.path.join(stream_dir, COMPLETE_MARKER), encoding='utf-8') as f: complete = json.load(f).get('num_chunks') == chunk_index
+    except (OSError, ValueError): pass
+
+    # Target duration must stay constant while the playlist grows; segments only overshoot by a frame
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', f"#EXT-X-TARGETDURATION:{math.ceil(segment_seconds) + 1}", '#EXT-X-MEDIA-SEQUENCE:0', '#EXT-X-PLAYLIST-TYPE:EVENT']
+    lines.extend(entries)
+    if complete: lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
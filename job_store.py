@@ -0,0 +1,148 @@
+import json
+import time
+import redis
+import celery_config
+
+# Per-job bookkeeping shared by the Flask app and every worker, kept next to Celery's results
+JOB_KEY_PREFIX = 'audiofy:job:'
+JOB_KEY_TTL = 7 * 24 * 3600
+PROGRESS_CHANNEL_PREFIX = 'audiofy:progress:'
+USER_JOBS_KEY_PREFIX = 'audiofy:user-jobs:'
+
+# Deduplication of identical conversions: (pdf hash, model, format, bitrate) -> task id
+DEDUP_KEY_PREFIX = 'audiofy:dedup:'
+DEDUP_OUTPUTS_KEY = 'audiofy:dedup-outputs' # Sorted set of completed dedup keys by completion time
+DEDUP_OUTPUT_INFO_KEY = 'audiofy:dedup-output-info' # dedup key -> '<task id>:<output size in bytes>'
+DEDUP_INFLIGHT_TTL = 24 * 3600
+DEDUP_RESULT_TTL = 7 * 24 * 3600
+DEDUP_STORAGE_BUDGET_BYTES = 20 * 1024**3
+
+# Workers advertise the queues they consume and the voices they have loaded, refreshed on a heartbeat
+WORKER_KEY_PREFIX = 'audiofy:worker:'
+
+_redis_client = None
+
+def get_redis():
+    global _redis_client
+    if _redis_client is None: _redis_client = redis.Redis.from_url(celery_config.result_backend, decode_responses=True)
+    return _redis_client
+
+def init_job_progress(job_id, num_chunks):
+    key = JOB_KEY_PREFIX + job_id
+    pipe = get_redis().pipeline()
+    pipe.hset(key, mapping={'chunks_total': num_chunks, 'chunks_done': 0})
+    pipe.expire(key, JOB_KEY_TTL)
+    pipe.execute()
+
+def set_job_fields(job_id, **fields):
+    key = JOB_KEY_PREFIX + job_id
+    pipe = get_redis().pipeline()
+    pipe.hset(key, mapping={k: v for k, v in fields.items() if v is not None})
+    pipe.expire(key, JOB_KEY_TTL)
+    pipe.execute()
+
+def get_job_field(job_id, field): return get_redis().hget(JOB_KEY_PREFIX + job_id, field)
+
+def get_job_fields(job_id): return get_redis().hgetall(JOB_KEY_PREFIX + job_id)
+
+def get_user_jobs(client_id): return get_redis().smembers(USER_JOBS_KEY_PREFIX + client_id)
+
+def add_user_job(client_id, job_id):
+    key = USER_JOBS_KEY_PREFIX + client_id
+    pipe = get_redis().pipeline()
+    pipe.sadd(key, job_id)
+    pipe.expire(key, JOB_KEY_TTL)
+    pipe.execute()
+
+def remove_user_jobs(client_id, job_ids): get_redis().srem(USER_JOBS_KEY_PREFIX + client_id, *job_ids)
+
+def mark_chunk_done(job_id):
+    key = JOB_KEY_PREFIX + job_id
+    pipe = get_redis().pipeline()
+    pipe.hincrby(key, 'chunks_done', 1)
+    pipe.hget(key, 'chunks_total')
+    done, total = pipe.execute()
+    return int(done), int(total or 0)
+
+def get_job_progress(job_id):
+    data = get_redis().hgetall(JOB_KEY_PREFIX + job_id)
+    return {k: int(v) for k, v in data.items() if v.lstrip('-').isdigit()}
+
+def publish_progress(job_id, state, info):
+    # Best effort: subscribers fall back to /status polling if an event is lost
+    try: get_redis().publish(PROGRESS_CHANNEL_PREFIX + job_id, json.dumps({'task_id': job_id, 'status': state, 'info': info}, default=str))
+    except redis.RedisError as e: print(f"[JobStore] Warning: Failed to publish progress for {job_id}: {e}")
+
+def subscribe_progress(job_id):
+    pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(PROGRESS_CHANNEL_PREFIX + job_id)
+    return pubsub
+
+def make_dedup_key(pdf_hash, model_filename, output_format, bitrate, split_chapters=False, model_version=None): return f"{DEDUP_KEY_PREFIX}{pdf_hash}:{model_filename}{f'@{model_version}' if model_version else ''}:{output_format}:{bitrate or 'default'}{':chapters' if split_chapters else ''}"
+
+def claim_conversion(dedup_key, task_id):
+    # Returns None if this task now owns the conversion, else the id of the task that already does
+    client = get_redis()
+    if client.set(dedup_key, task_id, nx=True, ex=DEDUP_INFLIGHT_TTL): return None
+    existing = client.get(dedup_key)
+    if existing is None: return None if client.set(dedup_key, task_id, nx=True, ex=DEDUP_INFLIGHT_TTL) else client.get(dedup_key)
+    return existing
+
+_RELEASE_CLAIM_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+def release_claim(dedup_key, task_id):
+    # Submission failed after claiming: free the key, unless another task has taken it over since
+    get_redis().eval(_RELEASE_CLAIM_SCRIPT, 1, dedup_key, task_id)
+
+def replace_claim(dedup_key, task_id):
+    # The previous owner failed or its output is gone
+    pipe = get_redis().pipeline()
+    pipe.set(dedup_key, task_id, ex=DEDUP_INFLIGHT_TTL)
+    pipe.zrem(DEDUP_OUTPUTS_KEY, dedup_key)
+    pipe.hdel(DEDUP_OUTPUT_INFO_KEY, dedup_key)
+    pipe.execute()
+
+def register_completed_output(dedup_key, task_id, size_bytes):
+    # Keeps the mapping for DEDUP_RESULT_TTL and returns the task ids whose outputs expired or were evicted
+    # (oldest first) to stay within DEDUP_STORAGE_BUDGET_BYTES; the caller removes their files
+    client = get_redis()
+    now = time.time()
+    pipe = client.pipeline()
+    pipe.set(dedup_key, task_id, ex=DEDUP_RESULT_TTL)
+    pipe.zadd(DEDUP_OUTPUTS_KEY, {dedup_key: now})
+    pipe.hset(DEDUP_OUTPUT_INFO_KEY, dedup_key, f"{task_id}:{size_bytes}")
+    pipe.zrange(DEDUP_OUTPUTS_KEY, 0, -1, withscores=True)
+    pipe.hgetall(DEDUP_OUTPUT_INFO_KEY)
+    *_, tracked, info = pipe.execute()
+
+    outputs = {}
+    for key, value in info.items():
+        owner, _, size = value.rpartition(':')
+        outputs[key] = (owner, int(size or 0))
+    total = sum(outputs.get(key, ('', 0))[1] for key, _ in tracked)
+
+    evicted = []
+    for key, completed_at in tracked:
+        expired = completed_at < now - DEDUP_RESULT_TTL
+        if key == dedup_key or not (expired or total > DEDUP_STORAGE_BUDGET_BYTES): continue
+        owner, size = outputs.get(key, (None, 0))
+        pipe = client.pipeline()
+        pipe.zrem(DEDUP_OUTPUTS_KEY, key)
+        pipe.hdel(DEDUP_OUTPUT_INFO_KEY, key)
+        if not expired: pipe.delete(key)
+        pipe.execute()
+        total -= size
+        if owner: evicted.append(owner)
+    return evicted
+
+def advertise_worker(hostname, queues, warm_models, ttl):
+    get_redis().set(WORKER_KEY_PREFIX + hostname, json.dumps({'queues': sorted(queues), 'warm_models': sorted(warm_models), 'seen_at': time.time()}), ex=ttl)
+
+def withdraw_worker(hostname): get_redis().delete(WORKER_KEY_PREFIX + hostname)
+
+def get_workers():
+    # {hostname: {'queues', 'warm_models', 'seen_at'}} of workers whose heartbeat hasn't expired
+    client = get_redis()
+    keys = list(client.scan_iter(match=WORKER_KEY_PREFIX + '*', count=100))
+    values = client.mget(keys) if keys else []
+    return {key[len(WORKER_KEY_PREFIX):]: json.loads(value) for key, value in zip(keys, values) if value}
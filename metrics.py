@@ -0,0 +1,114 @@
+import math
+import redis
+import celery_config
+import job_store
+
+# Histograms live in Redis so every worker process (on any host) adds to the same series; /metrics renders
+# them in the Prometheus text format. Each series is a hash: one field per (labels, bucket) plus sum and count.
+METRICS_KEY_PREFIX = 'audiofy:metrics:'
+
+FAST_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CHUNK_SECONDS_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+JOB_SECONDS_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400)
+
+HISTOGRAMS = {
+    'audiofy_queue_wait_seconds': ('Time from submission until a worker starts the job.', JOB_SECONDS_BUCKETS),
+    'audiofy_extract_page_seconds': ('Text extraction time per PDF page (cached pages excluded).', FAST_SECONDS_BUCKETS),
+    'audiofy_extract_seconds': ('Text extraction time per job.', JOB_SECONDS_BUCKETS),
+    'audiofy_synthesis_chunk_seconds': ('Piper synthesis time per chunk (cache hits excluded).', CHUNK_SECONDS_BUCKETS),
+    'audiofy_synthesis_chars_per_second': ('Piper throughput per chunk in input characters per second.', (25, 50, 100, 200, 400, 800, 1600, 3200, 6400)),
+    'audiofy_synthesis_realtime_factor': ('Piper synthesis seconds per second of audio produced.', (0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 4)),
+    'audiofy_encode_seconds': ('Final audio encode (chunk concatenation included) per job.', JOB_SECONDS_BUCKETS),
+    'audiofy_job_seconds': ('End-to-end job time from worker start to finished audio.', JOB_SECONDS_BUCKETS),
+}
+COUNTERS = {
+    'audiofy_jobs_total': 'Finished conversion jobs.',
+    'audiofy_chunks_total': 'Synthesized chunks, by whether the chunk audio cache was hit.',
+}
+
+_broker_client = None
+
+def _label_str(labels): return ','.join(f'{k}="{_escape(v)}"' for k, v in sorted((labels or {}).items()))
+
+def _escape(value): return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def observe(name, value, labels=None): observe_many(name, [value], labels)
+
+def observe_many(name, values, labels=None):
+    # Best effort, one round trip per call: metrics must never fail a conversion
+    if not values: return
+    buckets = HISTOGRAMS[name][1]
+    label_str = _label_str(labels)
+    try:
+        pipe = job_store.get_redis().pipeline(transaction=False)
+        key = METRICS_KEY_PREFIX + name
+        for value in values:
+            index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+            pipe.hincrby(key, f"{label_str}|{index}", 1)
+            pipe.hincrbyfloat(key, f"{label_str}|sum", value)
+            pipe.hincrby(key, f"{label_str}|count", 1)
+        pipe.execute()
+    except redis.RedisError as e: print(f"[Metrics] Warning: Failed to record {name}: {e}")
+
+def increment(name, labels=None, amount=1):
+    try: job_store.get_redis().hincrby(METRICS_KEY_PREFIX + name, _label_str(labels), amount)
+    except redis.RedisError as e: print(f"[Metrics] Warning: Failed to record {name}: {e}")
+
+def _format_value(value): return repr(float(value)) if not float(value).is_integer() else str(int(float(value)))
+
+def _series(name, label_str, extra=None):
+    labels = ','.join(part for part in (label_str, extra) if part)
+    return f"{name}{{{labels}}}" if labels else name
+
+def queue_lengths(queues):
+    # Messages waiting in the broker, across all priority levels of each queue
+    global _broker_client
+    if _broker_client is None: _broker_client = redis.Redis.from_url(celery_config.broker_url, decode_responses=True)
+    client = _broker_client
+    sep = celery_config.broker_transport_options.get('sep', ':')
+    pipe = client.pipeline(transaction=False)
+    for queue in queues:
+        for step in celery_config.broker_transport_options.get('priority_steps', [0]): pipe.llen(f"{queue}{sep}{step}" if step else queue)
+    counts = pipe.execute()
+    steps = len(counts) // max(1, len(queues))
+    return {queue: sum(counts[i * steps:(i + 1) * steps]) for i, queue in enumerate(queues)}
+
+def render_prometheus(queues=(), storage_report=None):
+    client = job_store.get_redis()
+    pipe = client.pipeline(transaction=False)
+    for name in list(HISTOGRAMS) + list(COUNTERS): pipe.hgetall(METRICS_KEY_PREFIX + name)
+    stored = dict(zip(list(HISTOGRAMS) + list(COUNTERS), pipe.execute()))
+    lines = []
+
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        by_labels = {}
+        for field, value in stored[name].items():
+            label_str, _, part = field.rpartition('|')
+            by_labels.setdefault(label_str, {})[part] = value
+        for label_str, parts in sorted(by_labels.items()):
+            cumulative = 0
+            for i, bound in enumerate(list(buckets) + [math.inf]):
+                cumulative += int(parts.get(str(i), 0))
+                le = '+Inf' if bound == math.inf else _format_value(bound)
+                le_label = f'le="{le}"'
+                lines.append(f"{_series(name + '_bucket', label_str, le_label)} {cumulative}")
+            lines.append(f"{_series(name + '_sum', label_str)} {_format_value(parts.get('sum', 0))}")
+            lines.append(f"{_series(name + '_count', label_str)} {int(parts.get('count', 0))}")
+
+    for name, help_text in COUNTERS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for label_str, value in sorted(stored[name].items()): lines.append(f"{_series(name, label_str)} {int(value)}")
+
+    if queues:
+        lines += ["# HELP audiofy_queue_length Tasks waiting in the broker.", "# TYPE audiofy_queue_length gauge"]
+        try:
+            for queue, length in queue_lengths(queues).items(): lines.append(f'audiofy_queue_length{{queue="{queue}"}} {length}')
+        except redis.RedisError as e: print(f"[Metrics] Warning: Failed to read queue lengths: {e}")
+
+    if storage_report: # Gauges from the storage janitor's last sweep (see storage.py)
+        for name, key, help_text in (('audiofy_storage_bytes', 'bytes', 'Disk space used per storage area.'), ('audiofy_storage_files', 'files', 'Files per storage area.'), ('audiofy_storage_free_bytes', 'free_bytes', 'Free space on the filesystem holding each storage area.')):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for area, info in sorted(storage_report.items()):
+                if info[key] is not None: lines.append(f'{name}{{area="{area}"}} {info[key]}')
+    return '\n'.join(lines) + '\n'
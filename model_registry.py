@@ -0,0 +1,80 @@
+import os
+import json
+import hashlib
+import time
+import threading
+
+# Index of the Piper voices in models/: every <name>.onnx plus what its <name>.onnx.json config says about it.
+# The directory is rescanned when the index is read and the last scan is older than RESCAN_SECONDS, so
+# voices that are added, replaced or removed show up without a restart; unchanged files are not re-read.
+# 'version' changes whenever the model or its config is replaced, since either changes the audio produced.
+RESCAN_SECONDS = 5.0
+
+def file_signature(path):
+    try: stat = os.stat(path)
+    except OSError: return None
+    return stat.st_size, stat.st_mtime
+
+def model_signature(model_path): return file_signature(model_path), file_signature(model_path + '.json') # Piper loads both
+
+def read_model_config(config_path):
+    # The parts of a Piper voice config used for planning; None for anything missing or unreadable
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f: config = json.load(f)
+    except (OSError, ValueError): config = {}
+    if not isinstance(config, dict): config = {}
+    audio, language, inference = (config.get(key) if isinstance(config.get(key), dict) else {} for key in ('audio', 'language', 'inference'))
+    espeak = config.get('espeak') if isinstance(config.get('espeak'), dict) else {}
+    return {'sample_rate': audio.get('sample_rate'), 'quality': audio.get('quality'), 'language': language.get('code') or espeak.get('voice'), 'num_speakers': config.get('num_speakers'), 'length_scale': inference.get('length_scale'), 'dataset': config.get('dataset')}
+
+class ModelRegistry:
+    def __init__(self, models_dir, rescan_seconds=RESCAN_SECONDS):
+        self.models_dir = models_dir
+        self.rescan_seconds = rescan_seconds
+        self._models = {}
+        self._signatures = {}
+        self._last_scan = None
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        # Returns [(model name, 'added' | 'changed' | 'removed')] since the previous scan
+        with self._lock:
+            if not force and self._last_scan is not None and time.time() - self._last_scan < self.rescan_seconds: return []
+            first_scan = self._last_scan is None
+            self._last_scan = time.time()
+            try: names = [f for f in os.listdir(self.models_dir) if f.lower().endswith('.onnx')]
+            except OSError as e:
+                print(f"[Models] Warning: Cannot list models directory {self.models_dir}: {e}")
+                names = []
+
+            models, signatures, changes = {}, {}, []
+            for name in names:
+                model_path = os.path.join(self.models_dir, name)
+                signature = model_signature(model_path)
+                if signature[0] is None: continue # Removed while scanning
+                if self._signatures.get(name) == signature: models[name] = self._models[name]
+                else:
+                    models[name] = dict(read_model_config(model_path + '.json'), name=name, size_bytes=signature[0][0], has_config=signature[1] is not None, version=hashlib.sha1(repr(signature).encode()).hexdigest()[:12])
+                    changes.append((name, 'changed' if name in self._models else 'added'))
+                signatures[name] = signature
+            changes += [(name, 'removed') for name in self._models if name not in models]
+            self._models, self._signatures = models, signatures
+
+        if first_scan: print(f"[Models] Found {len(models)} voice model(s) in {self.models_dir}.")
+        elif changes: print(f"[Models] Voice models updated: {', '.join(f'{name} {change}' for name, change in changes)}.")
+        return changes
+
+    def names(self):
+        self.refresh()
+        return sorted(self._models)
+
+    def get(self, name):
+        self.refresh()
+        info = self._models.get(name)
+        return dict(info) if info else None
+
+    def describe(self):
+        self.refresh()
+        return [dict(self._models[name]) for name in sorted(self._models)]
+
+    def path(self, name): return os.path.join(self.models_dir, name)
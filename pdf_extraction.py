@@ -0,0 +1,203 @@
+import os
+import time
+import uuid
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PyPDF2 import PdfReader
+
+# Kept free of Celery/Flask imports: this module is loaded by every extraction subprocess
+_executor = None
+_executor_lock = threading.Lock()
+
+# Bump when clean_page_text changes, so pages cached by an older version are extracted again
+PAGE_TEXT_VERSION = 2
+# PyPDF2 rarely emits blank lines between paragraphs, so a line this much shorter than the page's full
+# lines (a heading, the last line of a paragraph) also ends its paragraph
+PARAGRAPH_LINE_RATIO = 0.6
+
+def pdf_content_hash(pdf_path):
+    sha = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''): sha.update(block)
+    return sha.hexdigest()
+
+def clean_page_text(page_text):
+    # Collapses whitespace within lines and rejoins wrapped lines; paragraphs are kept apart by a blank line,
+    # which the chunker treats as a sentence end (so headings without punctuation are not run into the text)
+    if not page_text: return ''
+    lines = [' '.join(line.split()) for line in page_text.splitlines()]
+    widths = sorted(len(line) for line in lines if line)
+    short = widths[len(widths) * 3 // 4] * PARAGRAPH_LINE_RATIO if widths else 0
+    paragraphs, current = [], []
+    for line in lines:
+        if line: current.append(line)
+        if current and (not line or len(line) < short):
+            paragraphs.append(' '.join(current))
+            current = []
+    if current: paragraphs.append(' '.join(current))
+    return '\n\n'.join(paragraphs) + "\n"
+
+def extract_pages(pages, start, end, open_seconds=0.0):
+    # [(page_index, text, seconds)]; the time spent opening the reader is charged to the first page
+    results = []
+    for i in range(start, end):
+        page_start = time.perf_counter()
+        text = clean_page_text(pages[i].extract_text())
+        results.append((i, text, time.perf_counter() - page_start + open_seconds))
+        open_seconds = 0.0
+    return results
+
+_process_reader = None # (file signature, open file, PdfReader) kept by an extraction process between batches
+
+def _open_process_reader(pdf_path):
+    # Parsing the PDF costs about as much as extracting a few pages, so each pool process opens a document
+    # once and reuses the reader for every batch it is given; returns (pages, seconds spent opening)
+    global _process_reader
+    stat = os.stat(pdf_path)
+    signature = (os.path.abspath(pdf_path), stat.st_size, stat.st_mtime_ns)
+    if _process_reader and _process_reader[0] == signature: return _process_reader[2].pages, 0.0
+    if _process_reader: _process_reader[1].close()
+    _process_reader = None
+    open_start = time.perf_counter()
+    file = open(pdf_path, 'rb')
+    try: reader = PdfReader(file)
+    except Exception:
+        file.close()
+        raise
+    _process_reader = (signature, file, reader)
+    return reader.pages, time.perf_counter() - open_start
+
+def extract_page_range(pdf_path, start, end):
+    # Runs in a pool process; pages are independent, so any process can take any batch
+    pages, open_seconds = _open_process_reader(pdf_path)
+    return extract_pages(pages, start, end, open_seconds)
+
+def _get_executor(max_workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None: _executor = ProcessPoolExecutor(max_workers=max_workers)
+        return _executor
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None: _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def shutdown_executor(): _reset_executor()
+
+class PageTextCache:
+    # Extracted page text on disk, keyed by PDF content hash + page index; an empty file marks a textless page.
+    # Each PAGE_TEXT_VERSION gets its own directory per PDF; older ones age out through the storage janitor.
+    def __init__(self, root): self.root = root
+
+    def _page_path(self, pdf_hash, page_index): return os.path.join(self.root, pdf_hash[:2], f"{pdf_hash}-v{PAGE_TEXT_VERSION}", f"{page_index:05d}.txt")
+
+    def get(self, pdf_hash, page_index):
+        try:
+            with open(self._page_path(pdf_hash, page_index), encoding='utf-8') as f: return f.read()
+        except OSError: return None
+
+    def put(self, pdf_hash, page_index, text):
+        path = self._page_path(pdf_hash, page_index)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f: f.write(text)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[Extract] Warning: Failed to cache page {page_index}: {e}")
+            try: os.remove(tmp_path)
+            except OSError: pass
+
+class PdfTextExtractor:
+    # Yields (page_index, cleaned_text) in page order. Cached pages are served from disk, the rest are
+    # extracted in batches on a process pool with a bounded number of batches in flight.
+    def __init__(self, pdf_path, cache=None, max_workers=None, batch_pages=8, parallel_min_pages=16):
+        self.pdf_path = pdf_path
+        self.cache = cache
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.batch_pages = batch_pages
+        self.parallel_min_pages = parallel_min_pages
+        self.page_count = None
+        self.pdf_hash = None
+        self.page_timings = [] # (page_index, seconds); cached pages are not timed
+        self.cache_hits = 0
+
+    def slowest_pages(self, n=3): return sorted(self.page_timings, key=lambda t: t[1], reverse=True)[:n]
+
+    def _batches(self, missing):
+        batch = []
+        for page_index in missing:
+            if batch and (page_index != batch[-1] + 1 or len(batch) >= self.batch_pages):
+                yield batch[0], batch[-1] + 1
+                batch = []
+            batch.append(page_index)
+        if batch: yield batch[0], batch[-1] + 1
+
+    def _extract_serial(self, pages, ranges):
+        for start, end in ranges: yield from extract_pages(pages, start, end)
+
+    def _extract_parallel(self, pages, ranges):
+        try: executor = _get_executor(self.max_workers)
+        except (OSError, ValueError) as e:
+            print(f"[Extract] Process pool unavailable ({e}), extracting serially.")
+            yield from self._extract_serial(pages, ranges)
+            return
+
+        ranges = list(ranges)
+        window = self.max_workers * 2
+        futures = []
+        next_range = 0
+        yielded = set()
+        try:
+            while next_range < len(ranges) or futures:
+                while next_range < len(ranges) and len(futures) < window:
+                    futures.append(executor.submit(extract_page_range, self.pdf_path, *ranges[next_range]))
+                    next_range += 1
+                for result in futures.pop(0).result():
+                    yielded.add(result[0])
+                    yield result
+        except (BrokenProcessPool, AssertionError) as e:
+            # e.g. Celery prefork children are daemonic and may not start their own processes
+            print(f"[Extract] Process pool unavailable ({e}), extracting remaining pages serially.")
+            _reset_executor()
+            remaining = [(start, end) for start, end in ranges if not all(i in yielded for i in range(start, end))]
+            for result in self._extract_serial(pages, remaining):
+                if result[0] not in yielded: yield result
+        finally:
+            for future in futures: future.cancel()
+
+    def __iter__(self):
+        # One reader serves the page count and all serial extraction; its open time is charged to the first
+        # extracted page (pool processes do the same for their own reader), so page timings include it
+        open_start = time.perf_counter()
+        with open(self.pdf_path, 'rb') as file:
+            pages = PdfReader(file).pages
+            self.page_count = len(pages)
+            open_seconds = time.perf_counter() - open_start
+            cached = {}
+            if self.cache:
+                self.pdf_hash = pdf_content_hash(self.pdf_path)
+                for page_index in range(self.page_count):
+                    text = self.cache.get(self.pdf_hash, page_index)
+                    if text is not None: cached[page_index] = text
+                self.cache_hits = len(cached)
+
+            missing = [i for i in range(self.page_count) if i not in cached]
+            ranges = self._batches(missing)
+            use_pool = self.max_workers > 1 and len(missing) >= self.parallel_min_pages
+            extracted = self._extract_parallel(pages, ranges) if use_pool else self._extract_serial(pages, ranges)
+
+            for page_index in range(self.page_count):
+                if page_index in cached:
+                    text = cached.pop(page_index)
+                else:
+                    result_index, text, seconds = next(extracted)
+                    if result_index != page_index: raise RuntimeError(f"Page extraction out of order (expected {page_index}, got {result_index}).")
+                    self.page_timings.append((page_index, seconds + open_seconds))
+                    open_seconds = 0.0
+                    if self.cache and self.pdf_hash: self.cache.put(self.pdf_hash, page_index, text)
+                yield page_index, text
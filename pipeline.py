@@ -0,0 +1,80 @@
+import queue
+import threading
+
+_END = object()
+
+class PipelineCancelled(Exception): pass
+
+class BoundedPipeline:
+    # Runs a source iterator and a chain of stage functions in their own threads, linked by bounded queues,
+    # so a slow stage blocks the ones upstream instead of letting work pile up in memory.
+    # A stage function takes one item and returns the item for the next stage (or None to drop it).
+    def __init__(self, source, stages, queue_size=4, name='pipeline'):
+        self.source = source
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.name = name
+        self._cancelled = threading.Event()
+        self._errors = []
+
+    def _put(self, q, item):
+        while not self._cancelled.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return True
+            except queue.Full: continue
+        return False
+
+    def _get(self, q):
+        while not self._cancelled.is_set():
+            try: return q.get(timeout=0.2)
+            except queue.Empty: continue
+        return _END
+
+    def _fail(self, exc):
+        self._errors.append(exc)
+        self._cancelled.set()
+
+    def _run_source(self, out_q):
+        try:
+            for item in self.source:
+                if not self._put(out_q, item): return
+        except Exception as e: self._fail(e)
+        finally: self._put(out_q, _END)
+
+    def _run_stage(self, stage, in_q, out_q):
+        try:
+            while True:
+                item = self._get(in_q)
+                if item is _END: break
+                result = stage(item)
+                if result is not None and not self._put(out_q, result): return
+        except Exception as e: self._fail(e)
+        finally: self._put(out_q, _END)
+
+    def __iter__(self):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._run_source, args=(queues[0],), name=f"{self.name}-source", daemon=True)]
+        for i, stage in enumerate(self.stages):
+            threads.append(threading.Thread(target=self._run_stage, args=(stage, queues[i], queues[i + 1]), name=f"{self.name}-stage{i + 1}", daemon=True))
+        for thread in threads: thread.start()
+
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _END: break
+                yield item
+        except GeneratorExit:
+            self._cancelled.set()
+            raise
+        except Exception as e:
+            self._fail(e)
+            raise
+        finally:
+            if self._errors: self._cancelled.set()
+            for thread in threads: thread.join(timeout=5)
+
+        if self._errors: raise self._errors[0]
+        if self._cancelled.is_set(): raise PipelineCancelled(f"{self.name} was cancelled.")
+
+    def cancel(self): self._cancelled.set()
@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import queue
+import threading
+import subprocess
+from collections import OrderedDict, deque
+from model_registry import model_signature
+
+# Rough multiplier from .onnx file size to resident memory of a loaded voice (used when /proc is unavailable)
+RESIDENT_BYTES_FACTOR = 2.5
+
+class PiperEngineError(RuntimeError): pass
+
+class PiperEngine:
+    # One long-lived Piper process with a loaded model, fed JSON lines over stdin
+    def __init__(self, piper_command, model_path, response_timeout=600):
+        self.piper_command = list(piper_command) if isinstance(piper_command, (list, tuple)) else [piper_command]
+        self.model_path = model_path
+        self.response_timeout = response_timeout
+        self.lock = threading.Lock()
+        self.proc = None
+        self.last_used = time.time()
+        self.chunks_synthesized = 0
+        self.model_signature = None # Model and config files as loaded, to notice when they are replaced
+        self._stdout_lines = None
+        self._stderr_tail = deque(maxlen=50)
+
+    def start(self):
+        command = self.piper_command + ['--model', self.model_path, '--json-input']
+        print(f"[PiperPool] Starting engine for {os.path.basename(self.model_path)}: {' '.join(command)}")
+        creationflags = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+        self.model_signature = model_signature(self.model_path)
+        self.proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=creationflags)
+        self._stdout_lines = queue.Queue()
+        self._stderr_tail.clear()
+        threading.Thread(target=self._pump_stdout, args=(self.proc, self._stdout_lines), daemon=True).start()
+        threading.Thread(target=self._pump_stderr, args=(self.proc,), daemon=True).start()
+
+    def _pump_stdout(self, proc, lines):
+        for raw in proc.stdout: lines.put(raw.decode('utf-8', errors='replace').strip())
+        lines.put(None) # EOF marker
+
+    def _pump_stderr(self, proc):
+        for raw in proc.stderr: self._stderr_tail.append(raw.decode('utf-8', errors='replace').rstrip())
+
+    def is_alive(self): return self.proc is not None and self.proc.poll() is None
+
+    def is_stale(self): return self.is_alive() and model_signature(self.model_path) != self.model_signature
+
+    def stderr_tail(self, max_chars=500): return '\n'.join(self._stderr_tail)[-max_chars:]
+
+    def resident_bytes(self):
+        if self.is_alive():
+            try:
+                with open(f"/proc/{self.proc.pid}/status") as status:
+                    for line in status:
+                        if line.startswith('VmRSS:'): return int(line.split()[1]) * 1024
+            except (OSError, ValueError, IndexError): pass
+        try: return int(os.path.getsize(self.model_path) * RESIDENT_BYTES_FACTOR)
+        except OSError: return 0
+
+    def synthesize(self, text, output_path):
+        # Caller must hold self.lock
+        if not self.is_alive(): self.start()
+        target = os.path.abspath(output_path)
+        request_line = json.dumps({'text': text, 'output_file': target}, ensure_ascii=False) + "\n"
+
+        try:
+            self.proc.stdin.write(request_line.encode('utf-8'))
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            self.close()
+            raise PiperEngineError(f"Piper engine for {os.path.basename(self.model_path)} is not accepting input: {e}. Error: {self.stderr_tail()}")
+
+        deadline = time.time() + self.response_timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                self.close()
+                raise PiperEngineError(f"Piper engine timed out after {self.response_timeout}s. Model: {os.path.basename(self.model_path)}")
+            try: line = self._stdout_lines.get(timeout=remaining)
+            except queue.Empty: continue
+            if line is None:
+                code = self.close()
+                raise PiperEngineError(f"Piper engine exited (Code {code}). Model: {os.path.basename(self.model_path)}. Error: {self.stderr_tail()}")
+            if line and os.path.normcase(os.path.abspath(line)) == os.path.normcase(target): break
+
+        self.last_used = time.time()
+        self.chunks_synthesized += 1
+        return output_path
+
+    def close(self):
+        proc, self.proc = self.proc, None
+        if proc is None: return None
+        try:
+            if proc.stdin: proc.stdin.close()
+        except OSError: pass
+        try: proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        print(f"[PiperPool] Stopped engine for {os.path.basename(self.model_path)} after {self.chunks_synthesized} chunk(s).")
+        return proc.returncode
+
+class PiperEnginePool:
+    # Worker-level cache of warm Piper engines, evicted LRU when idle or over the memory cap. Each voice gets up to
+    # max_engines_per_model engines (one per task thread), so concurrent chunks of one voice synthesize in parallel:
+    # a chunk takes an idle engine of its voice, starts another while the budget allows, or else waits for one.
+    # Preloaded (pinned) engines are never evicted; an engine whose model files changed is restarted on next use.
+    def __init__(self, piper_command, max_engines=2, max_resident_bytes=2 * 1024**3, idle_timeout=600, response_timeout=600, max_engines_per_model=1):
+        self.piper_command = piper_command
+        self.max_engines = max_engines
+        self.max_engines_per_model = max_engines_per_model
+        self.max_resident_bytes = max_resident_bytes
+        self.idle_timeout = idle_timeout
+        self.response_timeout = response_timeout
+        self._engines = OrderedDict() # (model path, slot) -> engine, least recently used first
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self._engine_released = threading.Condition(self._lock)
+
+    def _acquire_engine(self, model_path):
+        # Returns an engine for model_path with its lock held; hand it back with _release_engine
+        model_key = os.path.abspath(model_path)
+        with self._lock:
+            while True:
+                own = [(key, engine) for key, engine in self._engines.items() if key[0] == model_key]
+                for key, engine in own:
+                    if engine.lock.acquire(blocking=False):
+                        self._engines.move_to_end(key)
+                        self._evict_locked()
+                        return engine
+                if not own or (len(own) < self.max_engines_per_model and self._has_room_locked(model_key)):
+                    slot = next(n for n in range(len(own) + 1) if (model_key, n) not in self._engines)
+                    engine = PiperEngine(self.piper_command, model_key, response_timeout=self.response_timeout)
+                    engine.pool_key = (model_key, slot)
+                    engine.lock.acquire()
+                    self._engines[engine.pool_key] = engine
+                    self._evict_locked()
+                    return engine
+                self._engine_released.wait() # Every engine of this voice is busy and there is no room for another
+
+    def _release_engine(self, engine):
+        engine.lock.release()
+        with self._lock: self._engine_released.notify_all()
+
+    def _has_room_locked(self, model_key):
+        # Extra engines for a busy voice only use spare budget; they never push out other voices
+        if len(self._engines) >= self.max_engines: return False
+        if not self.max_resident_bytes: return True
+        try: estimate = int(os.path.getsize(model_key) * RESIDENT_BYTES_FACTOR)
+        except OSError: return False
+        return self.resident_bytes() + estimate <= self.max_resident_bytes
+
+    def _evict_locked(self):
+        # Busy engines (lock held, including the caller's) are never evicted
+        now = time.time()
+        evictable = [(key, engine) for key, engine in self._engines.items() if key not in self._pinned]
+        for key, engine in evictable:
+            if now - engine.last_used > self.idle_timeout: self._try_close_locked(key, engine, 'idle')
+
+        # Oldest first: OrderedDict keeps least recently used at the front
+        for key, engine in evictable:
+            if key not in self._engines: continue
+            over_count = len(self._engines) > self.max_engines
+            over_memory = self.max_resident_bytes and self.resident_bytes() > self.max_resident_bytes
+            if not (over_count or over_memory): break
+            self._try_close_locked(key, engine, 'over budget')
+
+    def _try_close_locked(self, key, engine, reason):
+        if not engine.lock.acquire(blocking=False): return
+        try:
+            print(f"[PiperPool] Evicting {os.path.basename(key[0])} engine {key[1]} ({reason}).")
+            engine.close()
+            self._engines.pop(key, None)
+        finally: engine.lock.release()
+        self._engine_released.notify_all() # Room for an engine that a waiting chunk may start
+
+    def synthesize(self, model_path, text, output_path):
+        engine = self._acquire_engine(model_path)
+        try:
+            if engine.is_stale():
+                print(f"[PiperPool] Model files of {os.path.basename(model_path)} changed, reloading engine...")
+                engine.close()
+            was_warm = engine.chunks_synthesized > 0
+            try: return engine.synthesize(text, output_path)
+            except PiperEngineError:
+                if not was_warm: raise
+                print(f"[PiperPool] Engine for {os.path.basename(model_path)} failed, restarting once...")
+                return engine.synthesize(text, output_path)
+        finally: self._release_engine(engine)
+
+    def preload(self, model_path, pin=False):
+        engine = self._acquire_engine(model_path)
+        try:
+            if engine.is_stale(): engine.close()
+            if not engine.is_alive(): engine.start()
+        finally: self._release_engine(engine)
+        if pin:
+            with self._lock: self._pinned.add(engine.pool_key)
+        return engine
+
+    def resident_bytes(self): return sum(engine.resident_bytes() for engine in self._engines.values() if engine.is_alive())
+
+    def loaded_models(self): return sorted({os.path.basename(key[0]) for key, engine in self._engines.items() if engine.is_alive()})
+
+    def close_idle(self):
+        with self._lock: self._evict_locked()
+
+    def shutdown(self):
+        with self._lock:
+            for engine in self._engines.values():
+                with engine.lock: engine.close()
+            self._engines.clear()
+            self._pinned.clear()
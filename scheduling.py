@@ -0,0 +1,41 @@
+import os
+from PyPDF2 import PdfReader
+
+# Jobs are routed by estimated cost so a long book never sits in front of a short upload: each class has
+# its own queue and its own worker (see the launcher in app.py).
+SHORT_QUEUE = 'convert_short'
+LONG_QUEUE = 'convert_long'
+SHORT_JOB_MAX_PAGES = 60
+SHORT_JOB_MAX_BYTES = 25 * 1024**2
+
+# Rough single-worker synthesis time per page; only used for the estimate reported to clients
+SECONDS_PER_PAGE = 8.0
+
+# Redis transport priorities: 0 is delivered first (see broker_transport_options in celery_config).
+# Chunks and assembly of jobs that already started go ahead of new jobs in the same queue.
+CHUNK_PRIORITY = 0
+MAX_PRIORITY = 9
+
+MAX_ACTIVE_JOBS_PER_USER = 3
+# Tasks are acked early, so a job lost with its worker never reaches a final state. A job that has reported no
+# progress for this long no longer counts against the limit; queued jobs report nothing until a worker starts them.
+ACTIVE_JOB_STALL_SECONDS = 3600
+QUEUED_JOB_STALL_SECONDS = 12 * 3600
+
+# A worker that preloads a voice also consumes <queue>.<voice> for each of its queues (see preload_models in
+# tasks.py). Jobs for that voice go there while such a worker is alive, so they skip the model load.
+def voice_queue(queue, model_filename): return f"{queue}.{os.path.splitext(model_filename)[0]}"
+
+def warm_queue(queue, model_filename, workers):
+    # workers as returned by job_store.get_workers()
+    candidate = voice_queue(queue, model_filename)
+    return candidate if any(candidate in worker.get('queues', ()) for worker in workers.values()) else queue
+
+def estimate_job(pdf_path, size_bytes):
+    # Raises on unreadable PDFs, which /convert reports as a bad upload
+    with open(pdf_path, 'rb') as file: pages = len(PdfReader(file).pages)
+    if not pages: raise ValueError("PDF has no pages.")
+    short = pages <= SHORT_JOB_MAX_PAGES and size_bytes <= SHORT_JOB_MAX_BYTES
+    if short: priority = 1 + pages * 4 // (SHORT_JOB_MAX_PAGES + 1) # 1-4: smaller jobs first
+    else: priority = min(MAX_PRIORITY, 5 + pages // 500) # 5-9
+    return {'pages': pages, 'file_size_bytes': size_bytes, 'estimated_seconds': round(pages * SECONDS_PER_PAGE), 'job_class': 'short' if short else 'long', 'queue': SHORT_QUEUE if short else LONG_QUEUE, 'priority': priority}
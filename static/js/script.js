@@ -14,12 +14,25 @@ document.addEventListener('DOMContentLoaded', function() {
     const audioPlayer = document.getElementById('audio-player');
     const downloadBtn = document.getElementById('download-btn');
     const newConversionBtn = document.getElementById('new-conversion-btn');
+    const reviseBtn = document.getElementById('revise-btn');
+    const uploadText = document.querySelector('.upload-text');
     const errorMessageDiv = document.getElementById('error-message');
     const modelSelect = document.getElementById('model-select');
+    const formatSelect = document.getElementById('format-select');
+    const splitChaptersCheckbox = document.getElementById('split-chapters');
+    const streamPreview = document.getElementById('stream-preview');
+    const streamPlayer = document.getElementById('stream-player');
 
     let currentTaskId = null;
+    let finishedTaskId = null;
+    let revisionOf = null; // Finished task the next upload revises (its unchanged chunks are reused)
     let statusIntervalId = null;
+    let statusEventSource = null;
+    let streamUrl = null;
+    let hlsInstance = null;
     const POLLING_INTERVAL_MS = 3000;
+    const RESUMABLE_UPLOAD_MIN_BYTES = 16 * 1024 * 1024;
+    const UPLOAD_CHUNK_RETRIES = 5;
 
     setupEventListeners();    
     initializeTheme();      
@@ -40,6 +53,15 @@ document.addEventListener('DOMContentLoaded', function() {
         if (newConversionBtn) {
             newConversionBtn.addEventListener('click', resetUI);
         } else { console.warn("New conversion button not found (expected later)."); }
+
+        if (reviseBtn) {
+            reviseBtn.addEventListener('click', () => {
+                const previousTaskId = finishedTaskId;
+                resetUI();
+                revisionOf = previousTaskId;
+                if (uploadText) uploadText.textContent = 'Drop the Revised PDF Here';
+            });
+        }
     }
 
     async function fetchAndPopulateModels() {
@@ -194,12 +216,20 @@ document.addEventListener('DOMContentLoaded', function() {
         resetUIForProcessing(file.name);
 
         const formData = new FormData();
-        formData.append('pdf_file', file);
         formData.append('selected_model', modelSelect.value);
+        if (formatSelect && formatSelect.value) formData.append('output_format', formatSelect.value);
+        if (splitChaptersCheckbox && splitChaptersCheckbox.checked) formData.append('split_chapters', '1');
+        if (revisionOf) formData.append('previous_task_id', revisionOf);
 
         console.log(`Submitting /convert for Task: ${file.name} with Model: ${modelSelect.value}`);
 
-        fetch('/convert', { method: 'POST', body: formData })
+        // Large files go up in resumable chunks first, so a dropped connection doesn't restart the upload
+        const uploaded = file.size >= RESUMABLE_UPLOAD_MIN_BYTES
+            ? uploadResumable(file).then(uploadId => formData.append('upload_id', uploadId))
+            : Promise.resolve(formData.append('pdf_file', file));
+
+        uploaded
+        .then(() => fetch('/convert', { method: 'POST', body: formData }))
         .then(handleFetchResponse)
         .then(data => {
             if (data.status === 'queued' && data.task_id) {
@@ -207,7 +237,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 updateUIBasedOnStatus({task_id: currentTaskId, status: 'PENDING', message: 'Task submitted, waiting in queue...', info: { percent: 1, status: 'Queued' }});
                 processingNote.textContent = 'Audio generation can take time...';
                 processingNote.style.display = 'block';
-                startPollingStatus(currentTaskId);
+                startStatusUpdates(currentTaskId);
             } else {
                 throw new Error(data.message || 'Failed to queue task (invalid response).');
             }
@@ -229,6 +259,65 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    async function uploadResumable(file) {
+        const upload = await fetch('/uploads', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ filename: file.name, size: file.size }) }).then(handleFetchResponse);
+        let offset = upload.offset;
+        let failures = 0;
+
+        while (offset < file.size) {
+            try {
+                const chunk = file.slice(offset, offset + upload.chunk_size);
+                offset = (await fetch(`/uploads/${upload.upload_id}`, { method: 'PATCH', headers: { 'Upload-Offset': String(offset) }, body: chunk }).then(handleFetchResponse)).offset;
+                failures = 0;
+            } catch (error) {
+                const status = error.response ? error.response.status : 0;
+                if ((status >= 400 && status < 500 && status !== 409) || ++failures > UPLOAD_CHUNK_RETRIES) throw error;
+                console.warn(`Upload chunk failed (${error.message}), resuming...`);
+                await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+                offset = (await fetch(`/uploads/${upload.upload_id}`).then(handleFetchResponse)).offset; // Resume where the server left off
+            }
+            const percent = Math.floor(offset / file.size * 100);
+            if (progressDetailsText) progressDetailsText.textContent = `Uploading... ${percent}%`;
+            if (progressBar) progressBar.style.width = `${percent}%`;
+        }
+        return upload.upload_id;
+    }
+
+    function startStatusUpdates(taskId) {
+        stopPolling();
+        if (!window.EventSource) {
+            startPollingStatus(taskId);
+            return;
+        }
+
+        console.log(`Subscribing to progress events for Task ID: ${taskId}`);
+        const source = new EventSource(`/events/${taskId}`);
+        statusEventSource = source;
+
+        source.onmessage = (event) => {
+            if (!currentTaskId || taskId !== currentTaskId) {
+                stopPolling();
+                return;
+            }
+            const data = JSON.parse(event.data);
+            updateUIBasedOnStatus(data);
+
+            if (['SUCCESS', 'FAILURE', 'REVOKED'].includes(data.status)) {
+                console.log(`Task ${taskId} reached final state: ${data.status}. Closing event stream.`);
+                stopPolling();
+            }
+        };
+
+        source.onerror = () => {
+            if (statusEventSource !== source) return;
+            // The server closes the stream after a final state or a long idle period; polling covers both
+            console.warn("Progress event stream unavailable, falling back to polling.");
+            source.close();
+            statusEventSource = null;
+            if (currentTaskId === taskId) startPollingStatus(taskId);
+        };
+    }
+
     function startPollingStatus(taskId) {
         stopPolling();
         console.log(`Starting polling for Task ID: ${taskId}`);
@@ -269,6 +358,11 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function stopPolling() {
+        if (statusEventSource) {
+            statusEventSource.close();
+            statusEventSource = null;
+            console.log("Event stream closed.");
+        }
         if (statusIntervalId) {
             clearInterval(statusIntervalId);
             statusIntervalId = null;
@@ -327,6 +421,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
             case 'PROGRESS':
                 isProcessing = true;
+                if (data.stream_url) attachStream(data.stream_url);
                 let meta = data.info || {};
                 progressPercent = (typeof meta.percent === 'number' && meta.percent >= 0 && meta.percent <= 100) ? meta.percent : 50;
                 statusMessage = 'Processing...';
@@ -340,6 +435,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 progressPercent = 1;
                 statusMessage = 'Waiting in Queue...';
                 detailMessage = 'Job waiting for an available worker.';
+                if (data.queue && data.estimate) detailMessage = `Waiting ${Math.round(data.queue.wait_seconds)}s for a worker (${data.estimate.job_class} job, ${data.estimate.pages} pages).`;
                 progressBar.classList.add('indeterminate');
                 progressBar.classList.remove('processing');
                 break;
@@ -390,20 +486,57 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    function attachStream(url) {
+        if (!streamPlayer || !streamPreview || streamUrl === url) return;
+
+        if (streamPlayer.canPlayType('application/vnd.apple.mpegurl')) {
+            streamPlayer.src = url;
+        } else if (window.Hls && Hls.isSupported()) {
+            hlsInstance = new Hls();
+            hlsInstance.loadSource(url);
+            hlsInstance.attachMedia(streamPlayer);
+        } else {
+            console.warn("HLS playback not supported in this browser; waiting for the full file.");
+            return;
+        }
+
+        streamUrl = url;
+        streamPreview.style.display = 'block';
+        console.log(`Progressive playback attached: ${url}`);
+    }
+
+    function detachStream() {
+        if (hlsInstance) {
+            hlsInstance.destroy();
+            hlsInstance = null;
+        }
+        if (streamPlayer) {
+            streamPlayer.pause();
+            streamPlayer.removeAttribute('src');
+        }
+        if (streamPreview) streamPreview.style.display = 'none';
+        streamUrl = null;
+    }
+
     function showResult(data) {
         if (!uploadSection || !progressSection || !resultSection || !audioPlayer || !downloadBtn || !conversionDetailsDiv ) {
              console.error("Cannot display results, required UI elements are missing.");
              return;
         }
 
+        const resumeAt = streamPlayer && streamUrl ? streamPlayer.currentTime : 0;
+        detachStream();
+
         uploadSection.style.display = 'none';
         progressSection.style.display = 'none';
         resultSection.style.display = 'block';
 
         const resultInfo = data.info || {};
+        finishedTaskId = data.task_id;
 
         if (data.audio_url && data.download_url) {
             audioPlayer.src = data.audio_url;
+            if (resumeAt > 0) audioPlayer.addEventListener('loadedmetadata', () => { audioPlayer.currentTime = resumeAt; }, { once: true });
             downloadBtn.href = data.download_url;
              let downloadNameBase = "audiobook";
              if (resultInfo.original_filename) {
@@ -411,7 +544,8 @@ document.addEventListener('DOMContentLoaded', function() {
              } else {
                  downloadNameBase = `audio_${data.task_id.substring(0,8)}`;
              }
-             downloadBtn.download = `${downloadNameBase}.mp3`;
+             const audioExtension = (resultInfo.audio_filename || '').split('.').pop() || 'mp3';
+             downloadBtn.download = `${downloadNameBase}.${audioExtension}`;
 
         } else {
             console.error("Success reported, but audio URLs are missing:", data);
@@ -426,15 +560,41 @@ document.addEventListener('DOMContentLoaded', function() {
         if (resultInfo.original_filename) detailsHtml += `<p><i class="fas fa-file-pdf"></i> Source: ${escapeHTML(resultInfo.original_filename)}</p>`;
         if (resultInfo.selected_model) detailsHtml += `<p><i class="fas fa-robot"></i> Voice: ${escapeHTML(resultInfo.selected_model.replace('.onnx',''))}</p>`;
         if (resultInfo.num_chunks_processed) detailsHtml += `<p><i class="fas fa-puzzle-piece"></i> Chunks: ${resultInfo.num_chunks_processed}</p>`;
+        if (resultInfo.revision_of) detailsHtml += `<p><i class="fas fa-file-pen"></i> Revision: ${resultInfo.unchanged_chunks} of ${resultInfo.num_chunks_processed} chunks unchanged</p>`;
+        if (resultInfo.cache_hits) detailsHtml += `<p><i class="fas fa-bolt"></i> Reused: ${resultInfo.cache_hits} cached chunk(s)</p>`;
         if (resultInfo.duration_seconds) detailsHtml += `<p><i class="fas fa-stopwatch"></i> Time: ${resultInfo.duration_seconds} s</p>`;
         if (resultInfo.audio_filesize_bytes) detailsHtml += `<p><i class="fas fa-database"></i> Size: ${(resultInfo.audio_filesize_bytes / (1024*1024)).toFixed(2)} MB</p>`;
+        if (resultInfo.chapters && resultInfo.chapters.length) detailsHtml += renderChapters(resultInfo.chapters);
         conversionDetailsDiv.innerHTML = detailsHtml || '<p>Conversion complete.</p>';
+        conversionDetailsDiv.querySelectorAll('[data-seek]').forEach(link => link.addEventListener('click', event => {
+            event.preventDefault();
+            audioPlayer.currentTime = parseFloat(link.dataset.seek);
+            audioPlayer.play();
+        }));
+    }
+
+    function formatClock(seconds) {
+        const s = Math.floor(seconds);
+        const hms = [Math.floor(s / 3600), Math.floor(s / 60) % 60, s % 60];
+        return (hms[0] ? `${hms[0]}:` : '') + hms.slice(1).map(n => String(n).padStart(2, '0')).join(':');
+    }
+
+    function renderChapters(chapters) {
+        // Titles seek the player; chapters saved as separate files also get a download link
+        const items = chapters.map(chapter => {
+            const download = chapter.audio_filename ? ` <a href="/download/${encodeURIComponent(chapter.audio_filename)}" title="Download this chapter"><i class="fas fa-download"></i></a>` : '';
+            return `<li><a href="#" data-seek="${chapter.start_seconds}">${escapeHTML(chapter.title)}</a> <span class="chapter-time">${formatClock(chapter.start_seconds)}</span>${download}</li>`;
+        });
+        return `<p><i class="fas fa-list-ol"></i> Chapters: ${chapters.length}</p><ol class="chapter-list">${items.join('')}</ol>`;
     }
 
     function resetUI() {
         console.log("Resetting UI to initial state.");
         stopPolling();
+        detachStream();
         currentTaskId = null;
+        revisionOf = null;
+        if (uploadText) uploadText.textContent = 'Drag & Drop PDF Here';
 
         if (uploadSection) uploadSection.style.display = 'block';
         if (progressSection) progressSection.style.display = 'none';
@@ -466,6 +626,7 @@ document.addEventListener('DOMContentLoaded', function() {
     function resetUIForProcessing(filename = 'your file') {
           console.log(`Resetting UI for processing: ${filename}`); 
           stopPolling(); 
+          detachStream();
           currentTaskId = null; 
           clearError(); 
    
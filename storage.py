@@ -0,0 +1,158 @@
+import os
+import time
+import shutil
+import threading
+import redis
+import audio_files
+import job_store
+
+# Disk lifecycle for everything the app writes: per-job scratch (chunk WAVs), uploads, finished outputs
+# and the page text cache. A janitor thread in the web process applies the quotas below; workers also
+# clear scratch left behind by crashed jobs when they start. The chunk audio cache has its own budget.
+# Scratch holds a whole book of WAV per fan-out job, so it lives next to cache/ on the app's disk by default
+# rather than in a possibly small tmpfs; AUDIOFY_SCRATCH_DIR moves it elsewhere.
+SCRATCH_ROOT = os.environ.get('AUDIOFY_SCRATCH_DIR') or 'scratch'
+SCRATCH_ORPHAN_AGE_SECONDS = 6 * 3600 # A job's scratch untouched this long belongs to a job that died
+UPLOAD_MAX_AGE_SECONDS = 24 * 3600 # Uploaded PDFs plus partial and resumable uploads
+OUTPUT_MAX_AGE_SECONDS = 30 * 24 * 3600 # Since the output was last played or downloaded
+OUTPUT_MAX_BYTES = 50 * 1024**3
+OUTPUT_MIN_AGE_SECONDS = 3600 # Never evicted sooner, so running jobs and fresh results are safe
+PAGE_CACHE_MAX_AGE_SECONDS = 30 * 24 * 3600
+JANITOR_INTERVAL_SECONDS = 600
+ACCESS_TOUCH_SECONDS = 3600 # Recency is recorded at most this often per output
+
+last_report = None # Latest disk usage per area, published by the janitor for /metrics
+
+def tree_stats(path):
+    # (bytes, files, newest mtime) of a file or directory tree; entries vanishing mid-walk are skipped
+    try: stat = os.stat(path)
+    except OSError: return 0, 0, 0
+    if not os.path.isdir(path): return stat.st_size, 1, stat.st_mtime
+    total, files, newest = 0, 0, stat.st_mtime
+    for root, _, names in os.walk(path):
+        for name in names:
+            try: stat = os.stat(os.path.join(root, name))
+            except OSError: continue
+            total, files, newest = total + stat.st_size, files + 1, max(newest, stat.st_mtime)
+    return total, files, newest
+
+def remove_path(path):
+    if os.path.isdir(path): shutil.rmtree(path, ignore_errors=True)
+    else:
+        try: os.remove(path)
+        except OSError: pass
+
+def group_entries(folder, skip=()):
+    # {key: [paths]} for the top-level entries of folder, grouped by name up to the first dot, so an
+    # output (<task_id>.mp3), its sidecars, chapter files and HLS directory are handled as one unit
+    groups = {}
+    try: names = os.listdir(folder)
+    except OSError: return groups
+    for name in names:
+        if name in skip: continue
+        groups.setdefault(name.lstrip('.').split('.')[0], []).append(os.path.join(folder, name))
+    return groups
+
+def group_stats(paths):
+    stats = [tree_stats(path) for path in paths]
+    return sum(s[0] for s in stats), max(s[2] for s in stats)
+
+def remove_stale_groups(folder, max_age, now=None, skip=(), keep=None):
+    # Removes every group whose newest file is older than max_age, unless keep(group key) says it is still
+    # needed; returns (groups removed, bytes freed)
+    cutoff = (now or time.time()) - max_age
+    removed, freed = 0, 0
+    for key, paths in group_entries(folder, skip).items():
+        size, last_used = group_stats(paths)
+        if last_used >= cutoff or (keep and keep(key)): continue
+        for path in paths: remove_path(path)
+        removed, freed = removed + 1, freed + size
+    return removed, freed
+
+def upload_awaiting_worker(group_key):
+    # Uploads are named <task_id>_<name>.pdf. A job still waiting in the queue needs its PDF however long the
+    # wait, and the worker removes it once read; an upload with no job record is left to the age rule.
+    try: fields = job_store.get_job_fields(group_key.split('_')[0])
+    except redis.RedisError: return True # Unknown for now, the next sweep decides
+    return bool(fields.get('submitted_at')) and not fields.get('started_at') and not fields.get('finished_at')
+
+def evict_outputs(folder, max_bytes=OUTPUT_MAX_BYTES, max_age=OUTPUT_MAX_AGE_SECONDS, min_age=OUTPUT_MIN_AGE_SECONDS, now=None):
+    # Expires outputs unused for max_age, then evicts least recently used ones until under max_bytes
+    now = now or time.time()
+    outputs = []
+    for paths in group_entries(folder).values():
+        size, last_used = group_stats(paths)
+        outputs.append((last_used, size, paths))
+    outputs.sort(key=lambda output: output[0])
+    total = sum(output[1] for output in outputs)
+    removed, freed = 0, 0
+    for last_used, size, paths in outputs:
+        if last_used > now - min_age: break
+        if last_used >= now - max_age and total <= max_bytes: break
+        for path in paths: remove_path(path)
+        total, removed, freed = total - size, removed + 1, freed + size
+    return removed, freed
+
+def mark_accessed(audio_path):
+    # Bumps the sidecar's mtime when an output is served, which is what LRU eviction looks at
+    path = audio_files.sidecar_path(audio_path)
+    try:
+        if os.stat(path).st_mtime < time.time() - ACCESS_TOUCH_SECONDS: os.utime(path)
+    except OSError: pass
+
+def remove_orphaned_scratch(root=SCRATCH_ROOT, max_age=SCRATCH_ORPHAN_AGE_SECONDS):
+    # Several workers share a node's scratch root, so only directories idle for max_age are treated as orphans
+    removed, freed = remove_stale_groups(root, max_age)
+    if removed: print(f"[Storage] Removed scratch of {removed} abandoned job(s), {freed / 1024**2:.1f} MB freed.")
+    return removed, freed
+
+def disk_usage(areas):
+    # {area: {'bytes', 'files', 'free_bytes'}} for {area: path}
+    report = {}
+    for area, path in areas.items():
+        size, files, _ = tree_stats(path)
+        try: free = shutil.disk_usage(path).free
+        except OSError: free = None
+        report[area] = {'bytes': size, 'files': files, 'free_bytes': free}
+    return report
+
+class Janitor(threading.Thread):
+    def __init__(self, upload_folder, audio_folder, page_cache_folder, chunk_cache_folder, scratch_root=SCRATCH_ROOT, resumable_folder_name='resumable', interval=JANITOR_INTERVAL_SECONDS):
+        super().__init__(name='storage-janitor', daemon=True)
+        self.upload_folder = upload_folder
+        self.audio_folder = audio_folder
+        self.page_cache_folder = page_cache_folder
+        self.resumable_folder = os.path.join(upload_folder, resumable_folder_name)
+        self.resumable_folder_name = resumable_folder_name
+        self.scratch_root = scratch_root
+        self.areas = {'uploads': upload_folder, 'outputs': audio_folder, 'scratch': scratch_root, 'page_cache': page_cache_folder, 'chunk_cache': chunk_cache_folder}
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def sweep(self):
+        global last_report
+        start = time.time()
+        results = {
+            'uploads': remove_stale_groups(self.upload_folder, UPLOAD_MAX_AGE_SECONDS, skip=(self.resumable_folder_name,), keep=upload_awaiting_worker),
+            'resumable': remove_stale_groups(self.resumable_folder, UPLOAD_MAX_AGE_SECONDS),
+            'outputs': evict_outputs(self.audio_folder, OUTPUT_MAX_BYTES, OUTPUT_MAX_AGE_SECONDS, OUTPUT_MIN_AGE_SECONDS),
+            'scratch': remove_stale_groups(self.scratch_root, SCRATCH_ORPHAN_AGE_SECONDS),
+        }
+        results['page_cache'] = (0, 0)
+        for shard in group_entries(self.page_cache_folder): # <2-char shard>/<pdf hash>-v<version>/ per document
+            removed, freed = remove_stale_groups(os.path.join(self.page_cache_folder, shard), PAGE_CACHE_MAX_AGE_SECONDS)
+            results['page_cache'] = (results['page_cache'][0] + removed, results['page_cache'][1] + freed)
+        last_report = disk_usage(self.areas)
+
+        removed = ', '.join(f"{area} {count} ({freed / 1024**2:.1f} MB)" for area, (count, freed) in results.items() if count)
+        usage = ', '.join(f"{area} {info['bytes'] / 1024**2:.1f} MB" for area, info in last_report.items())
+        print(f"[Storage] Sweep took {time.time() - start:.2f}s. Removed: {removed or 'nothing'}. Usage: {usage}.")
+        return results
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try: self.sweep()
+            except Exception as e: print(f"[Storage] Warning: Sweep failed: {e}")
+            self._stop_event.wait(self.interval)
+
+    def stop(self): self._stop_event.set()
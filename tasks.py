@@ -1,10 +1,30 @@
 import os
-import tempfile
-import subprocess
 import time
-from celery import Celery
+import glob
+import shutil
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from celery import Celery, chord
+from celery.exceptions import Ignore
+from celery.signals import worker_init, worker_process_shutdown, worker_ready, worker_shutdown
 from PyPDF2 import PdfReader
 import celery_config
+from piper_pool import PiperEnginePool, PiperEngineError
+from model_registry import ModelRegistry
+import job_store
+from audio_cache import ChunkAudioCache
+from audio_encoder import PcmStreamEncoder, OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT, output_extension, wav_duration_seconds
+from pipeline import BoundedPipeline
+import hls
+import audio_files
+import metrics
+import chapters
+import storage
+import uploads
+from scheduling import SHORT_QUEUE, CHUNK_PRIORITY, voice_queue
+from pdf_extraction import PdfTextExtractor, PageTextCache, shutdown_executor
+from text_chunker import iter_sentences, iter_chunks, plan_chunks, plan_revision, manifest_entry
 
 # Defining constants and paths
 PIPER_PATH = r"piper\piper.exe"
@@ -13,216 +33,604 @@ FFMPEG_PATH = 'ffmpeg'
 UPLOAD_FOLDER = 'uploads'
 AUDIO_FOLDER = os.path.join('static', 'audio')
 
-def get_available_model_filenames():
-    if not os.path.isdir(MODELS_BASE_DIR):
-        print(f"[Worker] Warning: Models directory not found at {MODELS_BASE_DIR}")
-        return []
-    try: return [f for f in os.listdir(MODELS_BASE_DIR) if f.lower().endswith('.onnx')]
-    except OSError as e:
-        print(f"[Worker] Error listing models directory: {e}")
-        return []
+# Piper engine pool (warm processes per loaded voice, shared across chunks and tasks in this worker). A voice
+# gets up to one engine per task thread so the threads of a worker synthesize the same voice in parallel.
+PIPER_POOL_MAX_ENGINES = 2 # Raised to the engines-per-voice limit if that is higher
+PIPER_ENGINES_PER_MODEL = None # Defaults to the worker's concurrency (-c)
+PIPER_POOL_MAX_RESIDENT_BYTES = 2 * 1024**3
+PIPER_POOL_IDLE_TIMEOUT = 600
+PIPER_CHUNK_TIMEOUT = 600
+
+# 'fanout': chord of per-chunk subtasks across workers (chunk WAVs must live on storage every worker can reach)
+# 'stream': extract, synthesize and encode concurrently inside one worker, linked by bounded queues
+PIPELINE_MODE = 'fanout'
+STREAM_QUEUE_SIZE = 4
+CHUNK_MAX_RETRIES = 3
+JOB_SCRATCH_FOLDER = storage.SCRATCH_ROOT
+KEEP_UPLOADED_PDFS = False # Uploads are deleted once a job no longer needs the PDF
+
+# Sentence-aware chunking. Sizes are estimated synthesis cost in character-equivalents (see text_chunker).
+# Fan-out jobs are split into at least SYNTHESIS_SLOTS * CHUNKS_PER_SLOT chunks of balanced cost, so small
+# documents still use every worker and no worker is left with one large tail chunk.
+CHUNK_SIZE = 2500 # Upper bound per chunk (and the streaming-mode target)
+CHUNK_MIN_SIZE = 400
+SYNTHESIS_SLOTS = os.cpu_count() or 1 # Chunk worker processes across the cluster; set to match the deployment
+CHUNKS_PER_SLOT = 3
+
+# Content-addressed chunk audio cache, consulted before Piper
+CHUNK_CACHE_FOLDER = os.path.join('cache', 'chunks')
+CHUNK_CACHE_MAX_BYTES = 5 * 1024**3
+
+# Page text extraction (process pool across pages, cached by PDF content hash + page index)
+PAGE_CACHE_FOLDER = os.path.join('cache', 'pages')
+EXTRACT_MAX_WORKERS = None # Defaults to the CPU count
+SLOW_PAGE_SECONDS = 2.0
+
+# Progressive playback: HLS segments under static/audio/<task_id>/ published as each chunk finishes
+HLS_ENABLED = True
+
+# Voices this worker keeps loaded: comma-separated model filenames, or '*' for all. For each one the worker
+# also consumes <queue>.<voice>, where /convert sends jobs for that voice while the worker's heartbeat is live.
+PRELOAD_MODELS = os.environ.get('AUDIOFY_PRELOAD_MODELS', '')
+WORKER_HEARTBEAT_SECONDS = 30
+
+# Optional per-chapter files (<task_id>.chNN.<ext>), encoded alongside the full book
+CHAPTER_ENCODE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+model_registry = ModelRegistry(MODELS_BASE_DIR)
+
+heartbeat_stop = threading.Event()
+
+def get_available_model_filenames(): return model_registry.names()
 
 # Initialize Celery
 celery_app = Celery('tasks', broker=celery_config.broker_url, backend=celery_config.result_backend)
 celery_app.config_from_object(celery_config)
 os.makedirs(AUDIO_FOLDER, exist_ok=True)
 
-def extract_text_from_pdf(pdf_path):
-    text = ""
-    
+engine_pool = PiperEnginePool(PIPER_PATH, max_engines=PIPER_POOL_MAX_ENGINES, max_resident_bytes=PIPER_POOL_MAX_RESIDENT_BYTES, idle_timeout=PIPER_POOL_IDLE_TIMEOUT, response_timeout=PIPER_CHUNK_TIMEOUT)
+atexit.register(engine_pool.shutdown)
+chunk_cache = ChunkAudioCache(CHUNK_CACHE_FOLDER, CHUNK_CACHE_MAX_BYTES)
+page_cache = PageTextCache(PAGE_CACHE_FOLDER)
+atexit.register(shutdown_executor)
+
+@worker_init.connect
+def size_engine_pool(sender=None, **kwargs):
+    # sender is the worker controller; its concurrency is the number of task threads sharing the pool
+    engine_pool.max_engines_per_model = PIPER_ENGINES_PER_MODEL or getattr(sender, 'concurrency', None) or 1
+    engine_pool.max_engines = max(PIPER_POOL_MAX_ENGINES, engine_pool.max_engines_per_model)
+    print(f"[Worker] Piper pool: up to {engine_pool.max_engines_per_model} engine(s) per voice, {engine_pool.max_engines} in total.")
+
+@worker_process_shutdown.connect
+def shutdown_engine_pool(**kwargs):
+    engine_pool.shutdown()
+    shutdown_executor()
+
+@worker_ready.connect
+def remove_orphaned_scratch(**kwargs):
+    # Chunk WAVs of jobs that died with a previous worker are never assembled; reclaim them on startup
+    storage.remove_orphaned_scratch(JOB_SCRATCH_FOLDER)
+
+@worker_ready.connect
+def preload_models(sender=None, **kwargs):
+    # sender is the worker's consumer; runs once the worker is connected and consuming its queues
+    names = model_registry.names() if PRELOAD_MODELS.strip() == '*' else [name.strip() for name in PRELOAD_MODELS.split(',') if name.strip()]
+    warm = []
+    for name in names:
+        if not model_registry.get(name):
+            print(f"[Worker] Warning: Cannot preload '{name}': not found in {MODELS_BASE_DIR}.")
+            continue
+        try: engine_pool.preload(model_registry.path(name), pin=True)
+        except (OSError, PiperEngineError) as e:
+            print(f"[Worker] Warning: Failed to preload '{name}': {e}")
+            continue
+        warm.append(name)
+    if warm: print(f"[Worker] Preloaded {len(warm)} voice(s): {', '.join(warm)}")
+
+    queues = [queue.name for queue in sender.task_consumer.queues]
+    for queue in list(queues):
+        for name in warm:
+            sender.add_task_queue(voice_queue(queue, name))
+            queues.append(voice_queue(queue, name))
+    threading.Thread(target=advertise_worker, args=(sender.hostname, queues), name='worker-heartbeat', daemon=True).start()
+
+def advertise_worker(hostname, queues):
+    while not heartbeat_stop.is_set():
+        try: job_store.advertise_worker(hostname, queues, engine_pool.loaded_models(), ttl=WORKER_HEARTBEAT_SECONDS * 3)
+        except Exception as e: print(f"[Worker] Warning: Heartbeat failed: {e}")
+        heartbeat_stop.wait(WORKER_HEARTBEAT_SECONDS)
+
+@worker_shutdown.connect
+def withdraw_worker(sender=None, **kwargs):
+    # Stop routing jobs to this worker's voice queues right away instead of when the heartbeat expires
+    heartbeat_stop.set()
+    try: job_store.withdraw_worker(sender.hostname)
+    except Exception as e: print(f"[Worker] Warning: Could not withdraw worker: {e}")
+
+def release_uploaded_pdf(pdf_path):
+    if not KEEP_UPLOADED_PDFS: uploads.remove_quietly(pdf_path)
+
+def get_job_scratch_dir(job_id):
+    scratch_dir = os.path.join(JOB_SCRATCH_FOLDER, job_id)
+    os.makedirs(scratch_dir, exist_ok=True)
+    return scratch_dir
+
+def get_job_stream_dir(job_id): return os.path.join(AUDIO_FOLDER, job_id)
+
+def publish_stream_chunk(job_id, chunk_index, chunk_wav_path):
+    if not HLS_ENABLED: return
+    stream_dir = get_job_stream_dir(job_id)
+    try: segments = hls.publish_chunk_segments(FFMPEG_PATH, chunk_wav_path, stream_dir, chunk_index)
+    except Exception as e:
+        # The final file is still assembled from the WAV; only progressive playback loses this chunk
+        print(f"[Task {job_id} Chunk {chunk_index + 1}] Warning: Failed to publish stream segments: {e}")
+        segments = hls.publish_chunk_segments(FFMPEG_PATH, None, stream_dir, chunk_index)
+    print(f"[Task {job_id} Chunk {chunk_index + 1}] Published {len(segments)} stream segment(s).")
+
+def count_pdf_pages(pdf_path):
+    with open(pdf_path, 'rb') as file: return len(PdfReader(file).pages)
+
+def iter_pdf_page_texts(pdf_path):
+    # Lazily yields (page_index, cleaned_text) so synthesis can start before the last page is read
+    extractor = PdfTextExtractor(pdf_path, cache=page_cache, max_workers=EXTRACT_MAX_WORKERS)
+    extract_start = time.time()
     try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PdfReader(file)
-            page_count = len(pdf_reader.pages)
-            print(f"[Worker] Extracting text from {page_count} pages in {os.path.basename(pdf_path)}...")
-
-            for i, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                if page_text:
-                    # Cleaning
-                    page_text = ' '.join(page_text.split()) + "\n"
-                    text += page_text
-
-        if not text.strip():
-            raise ValueError("No text found in PDF (image-based or empty?).")
-        print(f"[Worker] Extracted {len(text)} characters.")
-
-        return text
-    
+        for i, page_text in extractor:
+            if i == 0: print(f"[Worker] Extracting text from {extractor.page_count} pages in {os.path.basename(pdf_path)} ({extractor.cache_hits} cached)...")
+            if page_text: yield i, page_text
+
     except Exception as e:
         print(f"[Worker] Error reading PDF: {e}")
         raise ValueError(f"Could not read or process PDF '{os.path.basename(pdf_path)}': {e}")
 
-def create_text_chunks(text, chunk_size=2500):
-    chunks = []
-    current_pos = 0
-    text_len = len(text)
+    metrics.observe_many('audiofy_extract_page_seconds', [seconds for _, seconds in extractor.page_timings])
+    slow_pages = [f"page {i + 1} ({seconds:.2f}s)" for i, seconds in extractor.slowest_pages() if seconds >= SLOW_PAGE_SECONDS]
+    print(f"[Worker] Extraction finished in {time.time() - extract_start:.2f}s ({len(extractor.page_timings)} extracted, {extractor.cache_hits} from cache).")
+    if slow_pages: print(f"[Worker] Warning: Slow pages in {os.path.basename(pdf_path)}: {', '.join(slow_pages)}")
+
+def extract_pages_from_pdf(pdf_path):
+    pages = list(iter_pdf_page_texts(pdf_path))
+    if not any(page_text.strip() for _, page_text in pages):
+        raise ValueError("No text found in PDF (image-based or empty?).")
+    print(f"[Worker] Extracted {sum(len(page_text) for _, page_text in pages)} characters.")
+
+    return pages
 
-    while current_pos < text_len:
-        end_pos = min(current_pos + chunk_size, text_len)
-        sentence_end = text.rfind('.', current_pos, end_pos + 1)
-        if sentence_end > current_pos + (chunk_size // 2):
-            end_pos = sentence_end + 1
-        elif end_pos < text_len:
-             space_pos = text.rfind(' ', current_pos, end_pos)
-             if space_pos > current_pos + (chunk_size // 3):
-                  end_pos = space_pos + 1
+def synthesize_chunk(job_id, chunk_index, chunk_text, selected_model_filename, chunk_wav_path):
+    # Returns (wav_path or None if Piper produced nothing, piper_seconds, cached_bytes)
+    chunk_num = chunk_index + 1
+    full_model_path = os.path.join(MODELS_BASE_DIR, selected_model_filename)
+    cache_key = chunk_cache.make_key(full_model_path, chunk_text)
+    cached_bytes = chunk_cache.get(cache_key, chunk_wav_path)
+    piper_dur = 0.0
+
+    if cached_bytes:
+        print(f"[Task {job_id} Chunk {chunk_num}] Cache hit ({cached_bytes} bytes), skipping Piper.")
+        metrics.increment('audiofy_chunks_total', {'cache': 'hit'})
+        return chunk_wav_path, piper_dur, cached_bytes
+
+    print(f"[Task {job_id} Chunk {chunk_num}] Running Piper ({len(chunk_text)} chars)...")
+
+    piper_start = time.time()
+    try: engine_pool.synthesize(full_model_path, chunk_text, chunk_wav_path)
+    except PiperEngineError as e: raise RuntimeError(f"Piper failed on chunk {chunk_num}. Model: {selected_model_filename}. Error: {e}")
+    piper_dur = time.time() - piper_start
+    print(f"[Task {job_id} Chunk {chunk_num}] Piper finished in {piper_dur:.2f}s.")
+    metrics.increment('audiofy_chunks_total', {'cache': 'miss'})
+
+    if not os.path.exists(chunk_wav_path) or os.path.getsize(chunk_wav_path) == 0:
+         print(f"[Task {job_id} Chunk {chunk_num}] Warning: Piper created empty/missing WAV for model {selected_model_filename}. Skipping chunk audio.")
+         try: os.remove(chunk_wav_path)
+         except OSError: pass
+         return None, piper_dur, 0
+
+    chunk_cache.put(cache_key, chunk_wav_path)
+    record_synthesis_metrics(selected_model_filename, len(chunk_text), piper_dur, chunk_wav_path)
+    return chunk_wav_path, piper_dur, 0
+
+def chapter_audio_path(job_id, chapter_index, output_format): return os.path.join(AUDIO_FOLDER, f"{job_id}.ch{chapter_index + 1:02d}.{output_extension(output_format)}")
+
+def finish_chapter_file(encoder, chapter, book_title):
+    # Closes a per-chapter encoder and writes its sidecar; returns the fields added to the chapter's result entry
+    encoder.close()
+    size = os.path.getsize(encoder.output_path) if os.path.exists(encoder.output_path) else 0
+    audio_files.write_sidecar(encoder.output_path, {'title': f"{book_title} - {chapter['index'] + 1:02d} {chapter['title']}", 'output_format': encoder.output_format, 'bitrate': encoder.bitrate, 'audio_duration_seconds': round(encoder.duration_seconds, 2), 'audio_filesize_bytes': size})
+    return {'audio_filename': os.path.basename(encoder.output_path), 'audio_filesize_bytes': size}
+
+def encode_chapter_file(job_id, chapter, wav_paths, book_title, output_format, bitrate):
+    encoder = PcmStreamEncoder(FFMPEG_PATH, chapter_audio_path(job_id, chapter['index'], output_format), output_format, bitrate)
+    try:
+        for wav_path in wav_paths: encoder.write_wav(wav_path)
+        return finish_chapter_file(encoder, chapter, book_title)
+    except Exception:
+        encoder.abort()
+        raise
+
+def finish_chapters(job_id, timeline, total_seconds, audio_path, output_format, book_title, chapter_files=None):
+    # Chapter list for the result (None without an outline); markers are embedded where the format supports them
+    if timeline is None: return None
+    timed = [dict(chapter, **(chapter_files or {}).get(chapter['index'], {})) for chapter in timeline.finish(total_seconds)]
+    spec = OUTPUT_FORMATS[output_format]
+    if spec['chapters'] and len(timed) > 1:
+        try:
+            chapters.embed_chapter_markers(FFMPEG_PATH, audio_path, timed, book_title, spec['args'])
+            print(f"[Task {job_id}] Added {len(timed)} chapter markers.")
+        except (OSError, RuntimeError) as e: print(f"[Task {job_id}] Warning: Could not add chapter markers: {e}")
+    return timed
+
+def load_previous_manifest(job_id, previous_task_id, selected_model_filename):
+    # The previous job's chunking is only worth reusing if its audio was made with the same voice
+    previous = audio_files.read_manifest(AUDIO_FOLDER, previous_task_id)
+    if previous is None: print(f"[Task {job_id}] No chunk manifest for previous job {previous_task_id} (expired?), converting from scratch.")
+    elif previous.get('model') != selected_model_filename:
+        print(f"[Task {job_id}] Previous job {previous_task_id} used voice {previous.get('model')}, converting from scratch.")
+        previous = None
+    return previous
+
+def record_synthesis_metrics(model_filename, chars, piper_seconds, wav_path):
+    labels = {'model': model_filename}
+    metrics.observe('audiofy_synthesis_chunk_seconds', piper_seconds, labels)
+    if piper_seconds > 0: metrics.observe('audiofy_synthesis_chars_per_second', chars / piper_seconds, labels)
+    try: audio_seconds = wav_duration_seconds(wav_path)
+    except (OSError, RuntimeError, ValueError): return
+    if audio_seconds > 0: metrics.observe('audiofy_synthesis_realtime_factor', piper_seconds / audio_seconds, labels)
+
+def record_job_metrics(status, mode, timings=None):
+    metrics.increment('audiofy_jobs_total', {'status': status, 'mode': mode})
+    if status != 'success' or not timings: return
+    if timings.get('encode_seconds') is not None: metrics.observe('audiofy_encode_seconds', timings['encode_seconds'], {'mode': mode})
+    metrics.observe('audiofy_job_seconds', timings['total_seconds'], {'mode': mode})
+
+def report_state(job_id, state, meta):
+    # Stored for /status polling and published for /events subscribers
+    celery_app.backend.store_result(job_id, meta, state)
+    job_store.publish_progress(job_id, state, meta)
+    if state == 'FAILURE': mark_job_finished(job_id, state)
+    else:
+        try: job_store.set_job_fields(job_id, updated_at=time.time()) # Liveness for the per-user job limit
+        except Exception: pass # publish_progress has already warned if Redis is down
+
+def mark_job_finished(job_id, state):
+    # Outlives Celery's result meta, so the per-user job limit and dedup can still tell the job is over
+    try: job_store.set_job_fields(job_id, finished_at=time.time(), final_state=state)
+    except Exception as e: print(f"[Task {job_id}] Warning: Could not record job end: {e}")
+
+def report_chunk_progress(job_id, chunks_done, chunks_total):
+    initial_piper_percent = 15
+    piper_percent_range = 70
+    progress_percent = initial_piper_percent + int((chunks_done / max(chunks_total, 1)) * piper_percent_range)
+    meta = {'status': f'Synthesized {chunks_done}/{chunks_total} chunks with Piper...', 'percent': progress_percent, 'chunks_done': chunks_done, 'chunks_total': chunks_total}
+    report_state(job_id, 'PROGRESS', meta)
+
+def cleanup_job_files(job_id, audio_path=None):
+    scratch_dir = os.path.join(JOB_SCRATCH_FOLDER, job_id)
+    if os.path.isdir(scratch_dir):
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        print(f"[Task {job_id}] Removed scratch directory {scratch_dir}")
+
+    if audio_path and os.path.exists(audio_path):
+         try: os.remove(audio_path); print(f"[Task {job_id}] Removed potentially failed output file.")
+         except OSError: pass
+    if audio_path:
+        for chapter_path in glob.glob(f"{glob.escape(os.path.splitext(audio_path)[0])}.ch[0-9]*"):
+            try: os.remove(chapter_path)
+            except OSError: pass
+        shutil.rmtree(get_job_stream_dir(job_id), ignore_errors=True)
+
+def remove_job_outputs(job_id):
+    for path in glob.glob(os.path.join(AUDIO_FOLDER, f"{glob.escape(job_id)}.*")):
+        try: os.remove(path)
+        except OSError: pass
+    shutil.rmtree(get_job_stream_dir(job_id), ignore_errors=True)
+
+def register_job_output(job_id, audio_path):
+    # Makes the finished output reusable by identical uploads (see /convert) and enforces the dedup TTL/budget
+    try:
+        dedup_key = job_store.get_job_field(job_id, 'dedup_key')
+        if not dedup_key: return
+        for evicted_job_id in job_store.register_completed_output(dedup_key, job_id, os.path.getsize(audio_path)):
+            print(f"[Task {job_id}] Evicting deduplicated output of job {evicted_job_id} (TTL/storage budget).")
+            remove_job_outputs(evicted_job_id)
+    except Exception as e: print(f"[Task {job_id}] Warning: Failed to register output for deduplication: {e}")
+
+def run_streaming_conversion(task, pdf_path, original_filename, selected_model_filename, start_time, output_format=DEFAULT_OUTPUT_FORMAT, bitrate=None, queue_wait=None, split_chapters=False):
+    task_id = task.request.id
+    audio_filename = f"{task_id}.{output_extension(output_format)}"
+    audio_path = os.path.join(AUDIO_FOLDER, audio_filename)
+    encoder = PcmStreamEncoder(FFMPEG_PATH, audio_path, output_format, bitrate)
+    pipeline = None
+    chapter_encoder = None # (chapter index, encoder) of the per-chapter file being written
+    chapter_files = {}
+    progress = {'pages_read': 0, 'chunks_seen': 0, 'chunks_encoded': 0, 'cache_hits': 0, 'cache_bytes_saved': 0, 'first_audio_seconds': None, 'synthesis_seconds': 0.0, 'encode_seconds': 0.0}
 
-        chunks.append(text[current_pos:end_pos].strip())
-        current_pos = end_pos
+    try:
+        report_state(task_id, 'PROGRESS', {'status': 'Extracting text...', 'percent': 5})
+        page_count = count_pdf_pages(pdf_path)
+        scratch_dir = get_job_scratch_dir(task_id)
+        book_title = os.path.splitext(original_filename)[0]
+        book_chapters = chapters.build_chapters(chapters.read_pdf_outline(pdf_path), book_title)
+        starts = chapters.chapter_starts(book_chapters)
+        timeline = chapters.ChapterTimeline(book_chapters) if book_chapters else None
+        if book_chapters: print(f"[Task {task_id}] Outline has {len(book_chapters)} chapters{' (writing one file per chapter)' if split_chapters else ''}.")
+
+        def page_texts():
+            for page_index, page_text in iter_pdf_page_texts(pdf_path):
+                progress['pages_read'] = page_index + 1
+                yield page_index, page_text
+
+        def synthesize_stage(chunk):
+            chunk_index, chunk_text = chunk['index'], chunk['text']
+            chunk_wav_path = os.path.join(scratch_dir, f"chunk_{chunk_index:05d}.wav")
+            chunk_wav_path, piper_dur, cached_bytes = synthesize_chunk(task_id, chunk_index, chunk_text, selected_model_filename, chunk_wav_path)
+            publish_stream_chunk(task_id, chunk_index, chunk_wav_path)
+            progress['chunks_seen'] = chunk_index + 1
+            progress['synthesis_seconds'] += piper_dur
+            if cached_bytes:
+                progress['cache_hits'] += 1
+                progress['cache_bytes_saved'] += cached_bytes
+            return (chunk_index, chunk_wav_path, chunk['chapter']) if chunk_wav_path else None
+
+        manifest = {'model': selected_model_filename, 'chunks': []}
+        def recorded(chunks):
+            for chunk in chunks:
+                manifest['chunks'].append(manifest_entry(chunk))
+                yield chunk
+
+        chunk_source = recorded(iter_chunks(iter_sentences(page_texts(), CHUNK_SIZE, starts), CHUNK_SIZE, starts))
+        pipeline = BoundedPipeline(chunk_source, [synthesize_stage], queue_size=STREAM_QUEUE_SIZE, name=f"stream-{task_id[:8]}")
+        print(f"[Task {task_id}] Streaming {page_count} pages through extract -> synthesize -> encode (queue size {STREAM_QUEUE_SIZE}).")
+
+        # Encoding is the sink and runs here, so PCM goes straight from each chunk WAV into one FFmpeg process
+        for chunk_index, chunk_wav_path, chapter_index in pipeline:
+            encode_start = time.time()
+            if timeline: timeline.mark(chapter_index, encoder.duration_seconds)
+            encoder.write_wav(chunk_wav_path)
+            if split_chapters and book_chapters:
+                # Chunks arrive in order, so each chapter file is finished as soon as the next chapter begins
+                if chapter_encoder and chapter_encoder[0] != chapter_index:
+                    chapter_files[chapter_encoder[0]] = finish_chapter_file(chapter_encoder[1], book_chapters[chapter_encoder[0]], book_title)
+                    chapter_encoder = None
+                if chapter_encoder is None: chapter_encoder = (chapter_index, PcmStreamEncoder(FFMPEG_PATH, chapter_audio_path(task_id, chapter_index, output_format), output_format, bitrate))
+                chapter_encoder[1].write_wav(chunk_wav_path)
+            progress['encode_seconds'] += time.time() - encode_start
+            os.remove(chunk_wav_path)
+            progress['chunks_encoded'] += 1
+            if progress['first_audio_seconds'] is None:
+                progress['first_audio_seconds'] = round(time.time() - start_time, 2)
+                print(f"[Task {task_id}] First audio reached the encoder after {progress['first_audio_seconds']:.2f}s.")
+
+            progress_percent = 10 + int((progress['pages_read'] / max(page_count, 1)) * 80)
+            report_state(task_id, 'PROGRESS', {'status': f"Encoded chunk {chunk_index + 1} (read {progress['pages_read']}/{page_count} pages)...", 'percent': min(progress_percent, 90), 'chunks_done': progress['chunks_encoded']})
+
+        if progress['chunks_encoded'] == 0: raise ValueError("No text found in PDF (image-based or empty?).")
+        report_state(task_id, 'PROGRESS', {'status': 'Finalizing audio...', 'percent': 95})
+        encode_start = time.time()
+        encoder.close()
+        if chapter_encoder:
+            chapter_files[chapter_encoder[0]] = finish_chapter_file(chapter_encoder[1], book_chapters[chapter_encoder[0]], book_title)
+            chapter_encoder = None
+        book_chapters = finish_chapters(task_id, timeline, encoder.duration_seconds, audio_path, output_format, book_title, chapter_files)
+        progress['encode_seconds'] += time.time() - encode_start
+        if HLS_ENABLED: hls.mark_stream_complete(get_job_stream_dir(task_id), progress['chunks_seen'])
+        print(f"[Task {task_id}] Final {output_format.upper()} file OK: {audio_path}")
+
+        total_duration = round(time.time() - start_time, 2)
+        print(f"[Task {task_id}] Streaming Conversion SUCCESSFUL. Total time: {total_duration:.2f}s")
+        # Stages overlap in this mode: extraction runs alongside synthesis, so it has no separate timing
+        timings = {'queue_wait_seconds': queue_wait, 'synthesis_seconds': round(progress['synthesis_seconds'], 2), 'encode_seconds': round(progress['encode_seconds'], 2), 'total_seconds': total_duration}
+
+        result = {'status': 'success', 'message': 'Conversion successful.', 'audio_filename': audio_filename, 'original_filename': original_filename, 'selected_model': selected_model_filename, 'output_format': output_format, 'bitrate': encoder.bitrate, 'audio_duration_seconds': round(encoder.duration_seconds, 2), 'duration_seconds': total_duration, 'num_chunks_processed': progress['chunks_encoded'], 'cache_hits': progress['cache_hits'], 'cache_misses': progress['chunks_encoded'] - progress['cache_hits'], 'cache_bytes_saved': progress['cache_bytes_saved'], 'first_audio_seconds': progress['first_audio_seconds'], 'chapters': book_chapters, 'timings': timings, 'audio_filesize_bytes': os.path.getsize(audio_path) if os.path.exists(audio_path) else 0}
+        record_job_metrics('success', 'stream', timings)
+        audio_files.write_sidecar(audio_path, result)
+        audio_files.write_manifest(AUDIO_FOLDER, task_id, manifest)
+        register_job_output(task_id, audio_path)
+        mark_job_finished(task_id, 'SUCCESS')
+        job_store.publish_progress(task_id, 'SUCCESS', result)
+        return result
+
+    except Exception as e:
+        error_message = str(e)
+        if pipeline: pipeline.cancel()
+        encoder.abort()
+        if chapter_encoder: chapter_encoder[1].abort()
+        report_state(task_id, 'FAILURE', {'error_message': error_message, 'status': 'Failed'})
+        print(f"[Task {task_id}] *** Streaming Task Failed! *** Model: {selected_model_filename}. Error: {error_message}")
+        record_job_metrics('failure', 'stream')
+        cleanup_job_files(task_id, audio_path)
+        raise e # Re-raise for Celery
 
-    return [chunk for chunk in chunks if chunk]
+    finally:
+        cleanup_job_files(task_id)
+        release_uploaded_pdf(pdf_path)
 
 @celery_app.task(bind=True)
-def task_convert_pdf(self, pdf_path, original_filename, selected_model_filename):
+def task_convert_pdf(self, pdf_path, original_filename, selected_model_filename, pipeline_mode=None, output_format=DEFAULT_OUTPUT_FORMAT, bitrate=None, queue=None, split_chapters=False, previous_task_id=None):
     task_id = self.request.id
+    start_time = time.time()
     print(f"[Task {task_id}] Starting chunked conversion for '{original_filename}'")
+    queue_wait = None
+    try:
+        submitted_at = job_store.get_job_field(task_id, 'submitted_at')
+        job_store.set_job_fields(task_id, started_at=start_time)
+        if submitted_at:
+            queue_wait = round(start_time - float(submitted_at), 2)
+            metrics.observe('audiofy_queue_wait_seconds', queue_wait, {'queue': queue or SHORT_QUEUE})
+            print(f"[Task {task_id}] Waited {queue_wait:.2f}s in queue '{queue or SHORT_QUEUE}'.")
+    except Exception as e: print(f"[Task {task_id}] Warning: Could not record start time: {e}")
     print(f"[Task {task_id}] Using model: {selected_model_filename}")
 
-    self.update_state(state='PROGRESS', meta={'status': 'Starting...', 'percent': 1})
-    temp_files_to_clean = []
-    audio_path = None
-    start_time = time.time()
-    chunk_wav_files = []
+    report_state(task_id, 'PROGRESS', {'status': 'Starting...', 'percent': 1})
 
     full_model_path = os.path.join(MODELS_BASE_DIR, selected_model_filename)
     if not os.path.exists(full_model_path):
         error_msg = f"Selected model file not found by worker: {selected_model_filename} (looked for {full_model_path})"
         print(f"[Task {task_id}] *** FATAL ERROR: {error_msg} ***")
 
-        self.update_state(state='FAILURE', meta={'error_message': error_msg, 'status': 'Failed'})
+        report_state(task_id, 'FAILURE', {'error_message': error_msg, 'status': 'Failed'})
+        release_uploaded_pdf(pdf_path)
         raise FileNotFoundError(error_msg)
-    try:
-        self.update_state(state='PROGRESS', meta={'status': 'Extracting text...', 'percent': 5})
-        full_text = extract_text_from_pdf(pdf_path)
+    if output_format not in OUTPUT_FORMATS:
+        error_msg = f"Unsupported output format '{output_format}'. Choose one of: {', '.join(OUTPUT_FORMATS)}"
+        report_state(task_id, 'FAILURE', {'error_message': error_msg, 'status': 'Failed'})
+        release_uploaded_pdf(pdf_path)
+        raise ValueError(error_msg)
+
+    if (pipeline_mode or PIPELINE_MODE) == 'stream':
+        # A revision has to see the whole document to match it against the previous one, so it always fans out
+        if previous_task_id: print(f"[Task {task_id}] Revision of {previous_task_id}: using fan-out instead of streaming.")
+        else: return run_streaming_conversion(self, pdf_path, original_filename, selected_model_filename, start_time, output_format, bitrate, queue_wait, split_chapters)
 
-        CHUNK_SIZE = 2500
-        text_chunks = create_text_chunks(full_text, CHUNK_SIZE)
+    try:
+        report_state(task_id, 'PROGRESS', {'status': 'Extracting text...', 'percent': 5})
+        extract_start = time.time()
+        pages = extract_pages_from_pdf(pdf_path)
+        extract_seconds = round(time.time() - extract_start, 2)
+        metrics.observe('audiofy_extract_seconds', extract_seconds)
+
+        book_chapters = chapters.build_chapters(chapters.read_pdf_outline(pdf_path), os.path.splitext(original_filename)[0])
+        if book_chapters: print(f"[Task {task_id}] Outline has {len(book_chapters)} chapters{' (writing one file per chapter)' if split_chapters else ''}.")
+        starts = chapters.chapter_starts(book_chapters)
+        previous = load_previous_manifest(task_id, previous_task_id, selected_model_filename) if previous_task_id else None
+        if previous:
+            text_chunks, unchanged_chunks = plan_revision(pages, previous['chunks'], CHUNK_SIZE, starts)
+            print(f"[Task {task_id}] Revision of {previous_task_id}: {unchanged_chunks} of {len(text_chunks)} chunks unchanged, {len(text_chunks) - unchanged_chunks} to synthesize.")
+        else: text_chunks = plan_chunks(pages, target_chunks=SYNTHESIS_SLOTS * CHUNKS_PER_SLOT, chunk_size=CHUNK_SIZE, min_chunk_size=CHUNK_MIN_SIZE, chapter_starts=starts)
+        manifest = {'model': selected_model_filename, 'chunks': [manifest_entry(c) for c in text_chunks]}
+        if previous: manifest.update(revision_of=previous_task_id, unchanged_chunks=unchanged_chunks)
         num_chunks = len(text_chunks)
-        print(f"[Task {task_id}] Text split into {num_chunks} chunks (approx size {CHUNK_SIZE}).")
+        if text_chunks: print(f"[Task {task_id}] Text split into {num_chunks} chunks (estimated cost {min(c['cost'] for c in text_chunks)}-{max(c['cost'] for c in text_chunks)} per chunk, {SYNTHESIS_SLOTS} synthesis slots).")
 
         if num_chunks == 0: raise ValueError("No text chunks generated after splitting.")
-        self.update_state(state='PROGRESS', meta={'status': f'Split into {num_chunks} chunks.', 'percent': 10})
-
-        initial_piper_percent = 15
-        piper_percent_range = 70
-
-        for i, chunk in enumerate(text_chunks):
-            chunk_num = i + 1
-            progress_percent = initial_piper_percent + int((chunk_num / num_chunks) * piper_percent_range)
-            self.update_state(state='PROGRESS', meta={'status': f'Processing chunk {chunk_num}/{num_chunks} with Piper...', 'percent': progress_percent})
-            chunk_wav_file = tempfile.NamedTemporaryFile(delete=False, suffix=f"_chunk{chunk_num}.wav")
-            chunk_wav_path = chunk_wav_file.name
-            chunk_wav_file.close()
-            temp_files_to_clean.append(chunk_wav_path)
-            print(f"[Task {task_id} Chunk {chunk_num}] Target WAV: {chunk_wav_path}")
-
-            piper_command = [ PIPER_PATH, '--model', full_model_path, '--output_file', chunk_wav_path ]
-            print(f"[Task {task_id} Chunk {chunk_num}] Running Piper ({len(chunk)} chars)...")
-
-            piper_start = time.time()
-            piper_result = subprocess.run(piper_command, input=chunk, capture_output=True, text=True, check=False, encoding='utf-8')
-            piper_dur = time.time() - piper_start
-            print(f"[Task {task_id} Chunk {chunk_num}] Piper finished in {piper_dur:.2f}s. Code: {piper_result.returncode}")
-
-            if piper_result.returncode != 0:
-                 stderr = piper_result.stderr[:500]
-                 raise RuntimeError(f"Piper failed on chunk {chunk_num} (Code {piper_result.returncode}). Model: {selected_model_filename}. Error: {stderr}")
-            if not os.path.exists(chunk_wav_path) or os.path.getsize(chunk_wav_path) == 0:
-                 print(f"[Task {task_id} Chunk {chunk_num}] Warning: Piper created empty/missing WAV for model {selected_model_filename}. Skipping chunk audio.")
-                 if chunk_wav_path in temp_files_to_clean: temp_files_to_clean.remove(chunk_wav_path)
-                 try: os.remove(chunk_wav_path)
-                 except OSError: pass
-            else: chunk_wav_files.append(chunk_wav_path)
-        
-        # Concatenate WAV files
-        self.update_state(state='PROGRESS', meta={'status': 'Joining audio chunks...', 'percent': 90})
+        job_store.init_job_progress(task_id, num_chunks)
+        report_state(task_id, 'PROGRESS', {'status': f'Split into {num_chunks} chunks.', 'percent': 10, 'chunks_done': 0, 'chunks_total': num_chunks})
+
+    except Exception as e:
+        error_message = str(e)
+        report_state(task_id, 'FAILURE', {'error_message': error_message, 'status': 'Failed'})
+        print(f"[Task {task_id}] *** Extraction Failed! *** Model: {selected_model_filename}. Error: {error_message}")
+        record_job_metrics('failure', 'fanout')
+        raise e # Re-raise for Celery
+
+    finally: release_uploaded_pdf(pdf_path) # Chunk subtasks only need the planned text
+
+    # Fan out one subtask per chunk; the join task inherits this task's id so /status/<task_id> keeps working.
+    # Subtasks stay on this job's queue, ahead of jobs that haven't started yet.
+    route = {'queue': queue or SHORT_QUEUE, 'priority': CHUNK_PRIORITY}
+    synthesis_tasks = [task_synthesize_chunk.s(task_id, chunk, selected_model_filename).set(**route) for chunk in text_chunks]
+    audio_filename = f"{task_id}.{output_extension(output_format)}"
+    timings = {'queue_wait_seconds': queue_wait, 'extract_seconds': extract_seconds}
+    join_task = task_assemble_audio.s(task_id, original_filename, selected_model_filename, start_time, output_format, bitrate, timings, book_chapters, split_chapters, manifest).set(**route).on_error(task_cleanup_failed_job.s(task_id, audio_filename).set(**route))
+    print(f"[Task {task_id}] Dispatching {num_chunks} chunk subtasks.")
+    return self.replace(chord(synthesis_tasks, join_task))
+
+def job_abandoned(job_id):
+    # The chord errback marks a fan-out job finished as soon as one chunk fails; its sibling chunks, still queued,
+    # retrying or running, then stop before writing into the scratch and stream dirs the errback removes
+    try: return bool(job_store.get_job_field(job_id, 'finished_at'))
+    except Exception: return False # Without Redis, carry on as if the job were still running
+
+# A missing model file won't reappear between retries (FileNotFoundError is an OSError)
+@celery_app.task(bind=True, autoretry_for=(RuntimeError, OSError), dont_autoretry_for=(FileNotFoundError,), max_retries=CHUNK_MAX_RETRIES, retry_backoff=True)
+def task_synthesize_chunk(self, job_id, chunk, selected_model_filename):
+    chunk_index, chunk_text = chunk['index'], chunk['text']
+    chunk_num = chunk_index + 1
+    full_model_path = os.path.join(MODELS_BASE_DIR, selected_model_filename)
+    if not os.path.exists(full_model_path): raise FileNotFoundError(f"Selected model file not found by worker: {selected_model_filename} (looked for {full_model_path})")
+    if job_abandoned(job_id):
+        print(f"[Task {job_id} Chunk {chunk_num}] Job already failed, skipping chunk.")
+        raise Ignore()
+
+    chunk_wav_path = os.path.join(get_job_scratch_dir(job_id), f"chunk_{chunk_index:05d}.wav")
+    print(f"[Task {job_id} Chunk {chunk_num}] Target WAV: {chunk_wav_path} (attempt {self.request.retries + 1})")
+    chunk_wav_path, piper_dur, cached_bytes = synthesize_chunk(job_id, chunk_index, chunk_text, selected_model_filename, chunk_wav_path)
+    if job_abandoned(job_id): # Failed while this chunk was synthesizing: the errback may already have cleaned up
+        print(f"[Task {job_id} Chunk {chunk_num}] Job failed during synthesis, discarding chunk.")
+        if chunk_wav_path: storage.remove_path(chunk_wav_path)
+        try: os.rmdir(os.path.join(JOB_SCRATCH_FOLDER, job_id)) # Only if no sibling left a WAV there either
+        except OSError: pass # Anything left behind goes with the janitor's orphaned scratch sweep
+        raise Ignore()
+    publish_stream_chunk(job_id, chunk_index, chunk_wav_path)
+
+    chunks_done, chunks_total = job_store.mark_chunk_done(job_id)
+    report_chunk_progress(job_id, chunks_done, chunks_total)
+
+    return {'index': chunk_index, 'wav_path': chunk_wav_path, 'chars': len(chunk_text), 'first_page': chunk['first_page'], 'last_page': chunk['last_page'], 'chapter': chunk.get('chapter', 0), 'piper_seconds': round(piper_dur, 3), 'cache_hit': bool(cached_bytes), 'cached_bytes': cached_bytes or 0}
+
+@celery_app.task(bind=True)
+def task_assemble_audio(self, chunk_results, job_id, original_filename, selected_model_filename, start_time, output_format=DEFAULT_OUTPUT_FORMAT, bitrate=None, timings=None, book_chapters=None, split_chapters=False, manifest=None):
+    task_id = job_id
+    audio_filename = f"{task_id}.{output_extension(output_format)}"
+    audio_path = os.path.join(AUDIO_FOLDER, audio_filename)
+    encoder = PcmStreamEncoder(FFMPEG_PATH, audio_path, output_format, bitrate)
+    chapter_pool = None
+
+    try:
+        ordered_results = [r for r in sorted(chunk_results, key=lambda r: r['index']) if r.get('wav_path')]
+        chunk_wav_files = [r['wav_path'] for r in ordered_results]
+        cache_hits = sum(1 for r in chunk_results if r.get('cache_hit'))
+        cache_bytes_saved = sum(r.get('cached_bytes', 0) for r in chunk_results)
+        print(f"[Task {task_id}] Chunk cache: {cache_hits} hit(s), {len(chunk_results) - cache_hits} miss(es), {cache_bytes_saved} bytes reused.")
         if not chunk_wav_files: raise RuntimeError("No valid audio chunks were generated by Piper.")
-        concat_list_file = tempfile.NamedTemporaryFile(delete=False, suffix=".txt", mode='w', encoding='utf-8')
-        concat_list_content = ""
-
-        for wav_file in chunk_wav_files:
-             safe_path = wav_file.replace('\\', '/')
-             line = f"file '{safe_path}'\n"
-             concat_list_file.write(line)
-             concat_list_content += line
-
-        concat_list_path = concat_list_file.name
-        concat_list_file.close()
-        temp_files_to_clean.append(concat_list_path)
-        print(f"[Task {task_id}] Created FFmpeg concat list: {concat_list_path}")
-        print(f"[Task {task_id}] Concat List File Content:\n---\n{concat_list_content}---")
-
-        combined_wav_file = tempfile.NamedTemporaryFile(delete=False, suffix="_combined.wav")
-        combined_wav_path = combined_wav_file.name
-        combined_wav_file.close()
-        temp_files_to_clean.append(combined_wav_path)
-        print(f"[Task {task_id}] Target combined WAV: {combined_wav_path}")
-
-        ffmpeg_concat_command = [ FFMPEG_PATH, '-y', '-f', 'concat', '-safe', '0', '-i', concat_list_path, '-c', 'copy', combined_wav_path ]
-        print(f"[Task {task_id}] Running FFmpeg concat...")
-
-        ffmpeg_cat_start = time.time()
-        ffmpeg_cat_result = subprocess.run(ffmpeg_concat_command, capture_output=True, text=True, check=False)
-        ffmpeg_cat_dur = time.time() - ffmpeg_cat_start
-        print(f"[Task {task_id}] FFmpeg concat finished in {ffmpeg_cat_dur:.2f}s. Code: {ffmpeg_cat_result.returncode}")
-
-        if ffmpeg_cat_result.returncode != 0:
-            stderr = ffmpeg_cat_result.stderr[:1000]
-            print(f"[Task {task_id}] FFmpeg concat Error Output:\n{stderr}")
-            raise RuntimeError(f"FFmpeg failed to concatenate WAV chunks (Code {ffmpeg_cat_result.returncode}). Error: {stderr[:200]}...")
-        
-        if not os.path.exists(combined_wav_path) or os.path.getsize(combined_wav_path) == 0:
-             print(f"[Task {task_id}] FFmpeg concat Error Output:\n{ffmpeg_cat_result.stderr}")
-             raise RuntimeError("FFmpeg concat produced an empty or missing combined WAV file.")
-        
-        else: print(f"[Task {task_id}] Combined WAV file OK. Size: {os.path.getsize(combined_wav_path)} bytes")
-
-        # Encode Combined WAV to MP3
-        self.update_state(state='PROGRESS', meta={'status': 'Encoding final MP3...', 'percent': 95})
-        audio_filename = f"{task_id}.mp3"
-        audio_path = os.path.join(AUDIO_FOLDER, audio_filename)
-        ffmpeg_encode_command = [ FFMPEG_PATH, '-i', combined_wav_path, '-y', '-vn', '-b:a', '192k', audio_path ]
-        print(f"[Task {task_id}] Running FFmpeg encode to MP3...")
 
+        # Single pass: chunk PCM is streamed in order into one FFmpeg encoder, no combined WAV on disk
+        report_state(task_id, 'PROGRESS', {'status': f'Encoding final {output_format.upper()}...', 'percent': 90})
+        print(f"[Task {task_id}] Encoding {len(chunk_wav_files)} chunk(s) to {output_format.upper()} in one pass...")
+
+        book_title = os.path.splitext(original_filename)[0]
+        timeline = chapters.ChapterTimeline(book_chapters) if book_chapters else None
         ffmpeg_enc_start = time.time()
-        ffmpeg_enc_result = subprocess.run( ffmpeg_encode_command, capture_output=True, text=True, check=False)
+        chapter_jobs = {}
+        if split_chapters and book_chapters:
+            # Chapters are independent, so their files are encoded in parallel with each other and the full book
+            wavs_by_chapter = {}
+            for r in ordered_results: wavs_by_chapter.setdefault(r.get('chapter', 0), []).append(r['wav_path'])
+            chapter_pool = ThreadPoolExecutor(max_workers=CHAPTER_ENCODE_WORKERS, thread_name_prefix=f"chapters-{task_id[:8]}")
+            chapter_jobs = {index: chapter_pool.submit(encode_chapter_file, task_id, book_chapters[index], wav_paths, book_title, output_format, bitrate) for index, wav_paths in wavs_by_chapter.items()}
+            print(f"[Task {task_id}] Encoding {len(chapter_jobs)} chapter file(s) alongside the full book ({CHAPTER_ENCODE_WORKERS} at a time).")
+
+        for i, r in enumerate(ordered_results):
+            if timeline: timeline.mark(r.get('chapter', 0), encoder.duration_seconds)
+            encoder.write_wav(r['wav_path'])
+            if (i + 1) % 10 == 0: report_state(task_id, 'PROGRESS', {'status': f'Encoding final {output_format.upper()} ({i + 1}/{len(chunk_wav_files)} chunks)...', 'percent': 90 + int((i + 1) / len(chunk_wav_files) * 9)})
+        encoder.close()
+        chapter_files = {index: job.result() for index, job in chapter_jobs.items()}
+        book_chapters = finish_chapters(task_id, timeline, encoder.duration_seconds, audio_path, output_format, book_title, chapter_files)
         ffmpeg_enc_dur = time.time() - ffmpeg_enc_start
-        print(f"[Task {task_id}] FFmpeg encode finished in {ffmpeg_enc_dur:.2f}s. Code: {ffmpeg_enc_result.returncode}")
-
-        if ffmpeg_enc_result.returncode != 0:
-            stderr = ffmpeg_enc_result.stderr[:1000]
-            print(f"[Task {task_id}] FFmpeg encode Error Output:\n{stderr}")
-            if "not found" in stderr.lower() or "no such file" in stderr.lower():
-                raise RuntimeError(f"FFmpeg command '{FFMPEG_PATH}' not found.")
-            raise RuntimeError(f"FFmpeg failed final MP3 encoding (Code {ffmpeg_enc_result.returncode}). Error: {stderr[:200]}...") 
-        else: print(f"[Task {task_id}] Final MP3 file OK: {audio_path}")
+        print(f"[Task {task_id}] FFmpeg encode finished in {ffmpeg_enc_dur:.2f}s.")
+        print(f"[Task {task_id}] Final {output_format.upper()} file OK: {audio_path}")
+        if HLS_ENABLED: hls.mark_stream_complete(get_job_stream_dir(task_id), len(chunk_results))
 
         end_time = time.time()
         total_duration = round(end_time - start_time, 2)
         print(f"[Task {task_id}] Chunked Conversion SUCCESSFUL. Total time: {total_duration:.2f}s")
-
-        return {'status': 'success', 'message': 'Conversion successful.', 'audio_filename': audio_filename, 'original_filename': original_filename, 'selected_model': selected_model_filename, 'duration_seconds': total_duration, 'num_chunks_processed': len(chunk_wav_files), 'audio_filesize_bytes': os.path.getsize(audio_path) if audio_path and os.path.exists(audio_path) else 0}
+        # synthesis_seconds is summed over chunks that ran in parallel, so it can exceed total_seconds
+        timings = dict(timings or {}, synthesis_seconds=round(sum(r.get('piper_seconds', 0) for r in chunk_results), 2), encode_seconds=round(ffmpeg_enc_dur, 2), total_seconds=total_duration)
+
+        result = {'status': 'success', 'message': 'Conversion successful.', 'audio_filename': audio_filename, 'original_filename': original_filename, 'selected_model': selected_model_filename, 'output_format': output_format, 'bitrate': encoder.bitrate, 'audio_duration_seconds': round(encoder.duration_seconds, 2), 'duration_seconds': total_duration, 'num_chunks_processed': len(chunk_wav_files), 'cache_hits': cache_hits, 'cache_misses': len(chunk_results) - cache_hits, 'cache_bytes_saved': cache_bytes_saved, 'chapters': book_chapters, 'revision_of': (manifest or {}).get('revision_of'), 'unchanged_chunks': (manifest or {}).get('unchanged_chunks'), 'timings': timings, 'audio_filesize_bytes': os.path.getsize(audio_path) if os.path.exists(audio_path) else 0}
+        record_job_metrics('success', 'fanout', timings)
+        audio_files.write_sidecar(audio_path, result)
+        if manifest: audio_files.write_manifest(AUDIO_FOLDER, task_id, manifest)
+        register_job_output(task_id, audio_path)
+        mark_job_finished(task_id, 'SUCCESS')
+        job_store.publish_progress(task_id, 'SUCCESS', result)
+        cleanup_job_files(task_id)
+        return result
 
     except Exception as e:
-        error_message = str(e)
-        self.update_state(state='FAILURE', meta={'error_message': error_message, 'status': 'Failed'})
-        print(f"[Task {task_id}] *** Chunked Task Failed! *** Model: {selected_model_filename}. Error: {error_message}")
-
-        if audio_path and os.path.exists(audio_path):
-             try: os.remove(audio_path); print(f"[Task {task_id}] Removed potentially failed output MP3.")
-             except OSError: pass
+        # The chord's errback (task_cleanup_failed_job) reports the failure and removes the files, as it does for chunk failures
+        encoder.abort()
+        if chapter_pool: chapter_pool.shutdown(wait=True, cancel_futures=True) # Before cleanup removes the chunk WAVs
+        print(f"[Task {task_id}] Assembly failed. Model: {selected_model_filename}. Error: {e}")
         raise e # Re-raise for Celery
 
     finally:
-        cleaned_count = 0
-        print(f"[Task {task_id}] Cleaning up {len(temp_files_to_clean)} temporary file(s)...")
-
-        for temp_file in temp_files_to_clean:
-             if temp_file and os.path.exists(temp_file):
-                  try:
-                      os.remove(temp_file)
-                      cleaned_count += 1
-                  except OSError as e: print(f"[Task {task_id}] Warning: Failed to remove temp file {temp_file}: {e}")
-                  
-        print(f"[Task {task_id}] Cleanup finished (removed {cleaned_count}).")
\ No newline at end of file
+        if chapter_pool: chapter_pool.shutdown(wait=False)
+
+@celery_app.task
+def task_cleanup_failed_job(request, exc, traceback, job_id, audio_filename=None):
+    # Errback of the chord body: the single place a failed fan-out job (chunk or assembly) is reported and cleaned up
+    print(f"[Task {job_id}] *** Chunked Task Failed! *** Error: {exc}")
+    record_job_metrics('failure', 'fanout')
+    mark_job_finished(job_id, 'FAILURE')
+    job_store.publish_progress(job_id, 'FAILURE', {'error_message': str(exc), 'status': 'Failed'})
+    cleanup_job_files(job_id, os.path.join(AUDIO_FOLDER, audio_filename or f"{job_id}.mp3"))
@@ -0,0 +1,192 @@
+import re
+import math
+import bisect
+import hashlib
+
+# Sentence terminators plus any closing quotes/brackets; Latin ones must be followed by whitespace so
+# decimals, URLs and "e.g.x" never split. CJK terminators need no trailing space.
+_SENTENCE_END = re.compile(r'[.!?…]+["\'”’»)\]]*(?=\s|$)|[。！？]+')
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+_WHITESPACE = re.compile(r'\s*')
+_CLAUSE_BREAK = re.compile(r'[,;:)\]]\s|\s[—–-]\s')
+_DIGIT = re.compile(r'\d')
+
+# Lowercase, without the trailing period. Single letters (initials) are always treated as abbreviations.
+ABBREVIATIONS = frozenset("""
+mr mrs ms mx dr prof rev hon sr jr st mt ft gen col lt sgt capt cmdr gov pres sen rep
+vs etc e.g i.e cf al viz approx ca est dept univ inc ltd co corp bros assn
+fig figs eq eqs no nos vol vols pp ch chap sec sect para ed eds trans op cit ibid
+jan feb mar apr jun jul aug sep sept oct nov dec mon tue wed thu fri sat sun
+u.s u.k u.n a.m p.m ph.d b.a m.a
+""".split())
+
+# Synthesis cost in character-equivalents: Piper's time grows with text length, plus a fixed
+# per-sentence overhead (phonemization, inter-sentence silence) and extra for digits, which are
+# expanded into several spoken words.
+SENTENCE_COST = 20
+DIGIT_COST = 3
+
+def text_hash(text): return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+def estimate_cost(text, num_sentences=1): return len(text) + (DIGIT_COST - 1) * len(_DIGIT.findall(text)) + SENTENCE_COST * num_sentences
+
+def _is_sentence_end(text, match):
+    if match.group()[0] != '.': return True
+    word = text[max(0, match.start() - 16):match.start()].rsplit(None, 1)
+    word = word[-1].lstrip('"\'“‘«([').lower() if word else ''
+    return not (len(word) == 1 and word.isalpha()) and word not in ABBREVIATIONS
+
+def _force_split(text, max_chars):
+    # Splits an over-long sentence at the last clause break (else space) before max_chars
+    pieces = []
+    while len(text) > max_chars:
+        cut = 0
+        for match in _CLAUSE_BREAK.finditer(text, max_chars // 2, max_chars): cut = match.end()
+        if not cut: cut = text.rfind(' ', max_chars // 3, max_chars) + 1
+        if not cut: cut = max_chars
+        pieces.append(text[:cut])
+        text = text[cut:]
+    pieces.append(text)
+    return pieces
+
+def chapter_of(chapter_starts, page_index): return max(0, bisect.bisect_right(chapter_starts, page_index) - 1)
+
+def iter_sentences(pages, max_chars=2500, chapter_starts=()):
+    # Incremental, linear-time segmenter over (page_index, text) pairs as produced by extraction.
+    # Yields (text, char_start, char_end, first_page, last_page) where the char offsets index into
+    # ''.join(page texts) and pages are inclusive. Paragraph breaks (blank lines) end a sentence;
+    # page breaks do not, since sentences routinely continue on the next page, except where a chapter
+    # starts (chapter_starts: sorted first page index of each chapter).
+    page_offsets, page_indexes = [], []
+    buffer, buffer_start, scan_pos = '', 0, 0
+
+    def emit(start, end):
+        for piece in _force_split(buffer[start:end], max_chars):
+            stripped = piece.strip()
+            if stripped:
+                lead = len(piece) - len(piece.lstrip())
+                char_start = buffer_start + start + lead
+                char_end = char_start + len(stripped)
+                first = page_indexes[bisect.bisect_right(page_offsets, char_start) - 1]
+                last = page_indexes[bisect.bisect_right(page_offsets, char_end - 1) - 1]
+                yield stripped, char_start, char_end, first, last
+            start += len(piece)
+
+    def drain(final):
+        nonlocal buffer, buffer_start, scan_pos
+        sentence_start = 0
+        breaks = [(m.start(), m.end(), True) for m in _PARAGRAPH_BREAK.finditer(buffer, scan_pos)]
+        ends = [(m.start(), m.end(), False) for m in _SENTENCE_END.finditer(buffer, scan_pos)]
+        for start, end, paragraph in sorted(breaks + ends):
+            if start < sentence_start: continue
+            after = _WHITESPACE.match(buffer, end).end()
+            if after == len(buffer) and not final:
+                # Can't judge this boundary (abbreviation followed by lowercase?) until more text arrives
+                scan_pos = start
+                break
+            if not paragraph:
+                match = _SENTENCE_END.match(buffer, start)
+                if not _is_sentence_end(buffer, match) or (after < len(buffer) and buffer[after].islower()): continue
+            yield from emit(sentence_start, end)
+            sentence_start = after
+        else: scan_pos = len(buffer)
+
+        if final: yield from emit(sentence_start, len(buffer))
+        elif len(buffer) - sentence_start > max_chars:
+            # A run without any boundary; flush all but the tail so the buffer (and rescans) stay bounded
+            keep = len(buffer) - max_chars // 2
+            keep = buffer.rfind(' ', sentence_start, keep) + 1 or keep
+            yield from emit(sentence_start, keep)
+            sentence_start = keep
+        buffer_start += sentence_start
+        buffer = buffer[sentence_start:]
+        scan_pos = max(0, scan_pos - sentence_start)
+
+    for page_index, text in pages:
+        if not text: continue
+        if page_offsets and chapter_of(chapter_starts, page_index) != chapter_of(chapter_starts, page_indexes[-1]):
+            yield from drain(True)
+            buffer_start, buffer, scan_pos = buffer_start + len(buffer), '', 0
+        page_offsets.append(buffer_start + len(buffer))
+        page_indexes.append(page_index)
+        buffer += text
+        yield from drain(False)
+    if page_offsets: yield from drain(True)
+
+def _make_chunk(index, sentences, cost, chapter):
+    return {'index': index, 'text': ' '.join(s[0] for s in sentences), 'char_start': sentences[0][1], 'char_end': sentences[-1][2], 'first_page': sentences[0][3], 'last_page': sentences[-1][4], 'chapter': chapter, 'num_sentences': len(sentences), 'first_sentence_hash': text_hash(sentences[0][0]), 'cost': cost}
+
+def _group_sentences(sentences, next_target, max_chars, chapter_starts=()):
+    # Greedy: a sentence joins the current chunk while that leaves the chunk closer to the target cost.
+    # A chunk never crosses into the next chapter, so every chapter is a whole number of chunks.
+    chunk, chunk_cost, chunk_chars, done_cost, index, chapter = [], 0, 0, 0, 0, 0
+    target = next_target(0, 0)
+    for sentence in sentences:
+        cost = estimate_cost(sentence[0])
+        sentence_chapter = chapter_of(chapter_starts, sentence[3])
+        if chunk and (sentence_chapter != chapter or chunk_chars + len(sentence[0]) + 1 > max_chars or 2 * chunk_cost + cost > 2 * target):
+            yield _make_chunk(index, chunk, chunk_cost, chapter)
+            index += 1
+            done_cost += chunk_cost
+            target = next_target(done_cost, index)
+            chunk, chunk_cost, chunk_chars = [], 0, 0
+        chunk.append(sentence)
+        chunk_cost += cost
+        chunk_chars += len(sentence[0]) + 1
+        chapter = sentence_chapter
+    if chunk: yield _make_chunk(index, chunk, chunk_cost, chapter)
+
+def iter_chunks(sentences, chunk_size=2500, chapter_starts=()):
+    # Streaming mode: total size is unknown, so every chunk aims for chunk_size
+    return _group_sentences(sentences, lambda done_cost, done_chunks: chunk_size, chunk_size, chapter_starts)
+
+def plan_chunks(pages, target_chunks=1, chunk_size=2500, min_chunk_size=400, chapter_starts=()):
+    # Fan-out mode: splits into at least target_chunks chunks of near-equal estimated synthesis cost
+    # (so no worker is left with one oversized tail chunk), never above chunk_size chars per chunk
+    # (bounded retry cost) and, unless the text is tiny, never below min_chunk_size.
+    sentences = list(iter_sentences(pages, chunk_size, chapter_starts))
+    if not sentences: return []
+    total_cost = sum(estimate_cost(s[0]) for s in sentences)
+    num_chunks = max(target_chunks, math.ceil(total_cost / chunk_size))
+    num_chunks = max(1, min(num_chunks, total_cost // min_chunk_size, len(sentences)))
+    next_target = lambda done_cost, done_chunks: (total_cost - done_cost) / max(1, num_chunks - done_chunks)
+    return list(_group_sentences(sentences, next_target, chunk_size, chapter_starts))
+
+def manifest_entry(chunk):
+    # What a later revision of the document needs to find this chunk again (see plan_revision)
+    return {'first_sentence_hash': chunk['first_sentence_hash'], 'num_sentences': chunk['num_sentences'], 'text_hash': text_hash(chunk['text'])}
+
+def plan_revision(pages, previous_chunks, chunk_size=2500, chapter_starts=()):
+    # Edited document: every run of sentences that exactly matches a chunk of the previous version (its
+    # manifest entries) becomes that chunk again, with identical text and therefore a chunk audio cache hit.
+    # Only the sentences in between (the edits) are grouped into new chunks. Returns (chunks, reused count).
+    sentences = list(iter_sentences(pages, chunk_size, chapter_starts))
+    hashes = [text_hash(s[0]) for s in sentences]
+    candidates = {}
+    for entry in previous_chunks: candidates.setdefault(entry['first_sentence_hash'], []).append(entry)
+
+    chunks, changed, reused = [], [], 0
+    def flush_changed():
+        chunks.extend(_group_sentences(changed, lambda done_cost, done_chunks: chunk_size, chunk_size, chapter_starts))
+        changed.clear()
+
+    i = 0
+    while i < len(sentences):
+        match = None
+        for entry in candidates.get(hashes[i], ()):
+            run = sentences[i:i + entry['num_sentences']]
+            if len(run) == entry['num_sentences'] and chapter_of(chapter_starts, run[0][3]) == chapter_of(chapter_starts, run[-1][3]) and text_hash(' '.join(s[0] for s in run)) == entry['text_hash']:
+                match = run
+                break
+        if match is None:
+            changed.append(sentences[i])
+            i += 1
+            continue
+        flush_changed()
+        chunks.append(_make_chunk(0, match, sum(estimate_cost(s[0]) for s in match), chapter_of(chapter_starts, match[0][3])))
+        reused += 1
+        i += len(match)
+    flush_changed()
+
+    for index, chunk in enumerate(chunks): chunk['index'] = index
+    return chunks, reused
@@ -0,0 +1,141 @@
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = 500 * 1024**2
+RESUMABLE_FOLDER_NAME = 'resumable'
+RESUMABLE_CHUNK_BYTES = 8 * 1024**2 # Largest body accepted per resumable chunk request
+PDF_MAGIC = b'%PDF-'
+PDF_MAGIC_SEARCH_BYTES = 1024 # Readers accept a little junk before the header, so look that far
+_UPLOAD_ID = re.compile(r'[0-9a-f]{32}')
+
+class UploadRejected(Exception):
+    # Not a ValueError on purpose: Werkzeug's form parser silently swallows those
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def remove_quietly(path):
+    if path and os.path.exists(path):
+        try: os.remove(path)
+        except OSError: pass
+
+class PdfUploadValidator:
+    # Checked block by block as the upload arrives: size limit, PDF header, SHA-256 of the content
+    def __init__(self, max_bytes=MAX_UPLOAD_BYTES, check_header=True):
+        self.max_bytes = max_bytes
+        self.sha = hashlib.sha256()
+        self.size = 0
+        self.header_ok = not check_header
+        self._head = b''
+
+    def update(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes: raise UploadRejected(f"File is larger than the {self.max_bytes // 1024**2} MB limit.", 413)
+        if not self.header_ok:
+            self._head = (self._head + bytes(data[:PDF_MAGIC_SEARCH_BYTES]))[:PDF_MAGIC_SEARCH_BYTES]
+            if PDF_MAGIC in self._head: self.header_ok = True
+            elif len(self._head) >= PDF_MAGIC_SEARCH_BYTES: raise UploadRejected("Invalid file (not a PDF).")
+        self.sha.update(data)
+
+    def finish(self):
+        if not self.header_ok: raise UploadRejected("Invalid file (not a PDF).")
+        return self.sha.hexdigest(), self.size
+
+class StreamedUpload:
+    # Werkzeug stream factory target: the multipart parser writes the file part straight into the upload
+    # folder through the validator, instead of into a spooled temp file that has to be copied afterwards
+    def __init__(self, folder, max_bytes=MAX_UPLOAD_BYTES):
+        self.path = os.path.join(folder, f".incoming_{uuid.uuid4().hex}.part")
+        self.validator = PdfUploadValidator(max_bytes)
+        self.kept = False
+        self._file = open(self.path, 'w+b')
+
+    def write(self, data):
+        try: self.validator.update(data)
+        except UploadRejected:
+            self.close() # The parser aborts, so nothing else would clean this file up
+            raise
+        return self._file.write(data)
+
+    def keep(self, dest_path):
+        # Moves (not copies) the finished upload into place; returns (sha256 hex, size in bytes)
+        digest, size = self.validator.finish()
+        self._file.close()
+        os.replace(self.path, dest_path)
+        self.kept = True
+        return digest, size
+
+    def close(self):
+        self._file.close()
+        if not self.kept: remove_quietly(self.path)
+
+    def __getattr__(self, name): return getattr(self._file, name)
+
+# Resumable uploads: the client declares the file, then sends it in order as raw chunks at the offset the
+# server reports, resuming from that offset after a dropped connection. State is a .part file plus a small
+# JSON sidecar under <upload folder>/resumable/, so any web process can continue an upload.
+def _resumable_paths(folder, upload_id):
+    if not _UPLOAD_ID.fullmatch(upload_id or ''): raise UploadRejected("Unknown upload.", 404)
+    base = os.path.join(folder, RESUMABLE_FOLDER_NAME, upload_id)
+    return f"{base}.part", f"{base}.json"
+
+def create_resumable_upload(folder, filename, size, max_bytes=MAX_UPLOAD_BYTES):
+    if size <= 0: raise UploadRejected("Empty file.")
+    if size > max_bytes: raise UploadRejected(f"File is larger than the {max_bytes // 1024**2} MB limit.", 413)
+    upload_id = uuid.uuid4().hex
+    part_path, info_path = _resumable_paths(folder, upload_id)
+    os.makedirs(os.path.dirname(part_path), exist_ok=True)
+    open(part_path, 'wb').close()
+    with open(info_path, 'w', encoding='utf-8') as f: json.dump({'filename': filename, 'size': size, 'created_at': time.time()}, f)
+    return upload_id
+
+def get_resumable_upload(folder, upload_id):
+    part_path, info_path = _resumable_paths(folder, upload_id)
+    try:
+        with open(info_path, encoding='utf-8') as f: info = json.load(f)
+        info['offset'] = os.path.getsize(part_path)
+    except (OSError, ValueError): raise UploadRejected("Unknown upload.", 404)
+    info['complete'] = info['offset'] == info['size']
+    return info
+
+def append_resumable_chunk(folder, upload_id, offset, stream, block_size=UPLOAD_BLOCK_SIZE):
+    # Appends the request body at offset (which must be the current end of the upload); returns the new offset.
+    # Bytes received before a dropped connection are kept, so the client resumes from the reported offset.
+    info = get_resumable_upload(folder, upload_id)
+    if offset != info['offset']: raise UploadRejected(f"Expected offset {info['offset']}.", 409)
+    part_path, _ = _resumable_paths(folder, upload_id)
+    validator = PdfUploadValidator(min(RESUMABLE_CHUNK_BYTES, info['size'] - offset), check_header=offset == 0)
+    with open(part_path, 'r+b') as part:
+        part.seek(offset)
+        try:
+            while True:
+                block = stream.read(block_size)
+                if not block: break
+                validator.update(block)
+                part.write(block)
+            if offset == 0: validator.finish()
+        except UploadRejected:
+            if offset == 0: part.truncate(0)
+            raise
+    return offset + validator.size
+
+def finish_resumable_upload(folder, upload_id, dest_path, block_size=UPLOAD_BLOCK_SIZE):
+    # Moves a completed upload to dest_path; returns (sha256 hex, size in bytes) like StreamedUpload.keep
+    info = get_resumable_upload(folder, upload_id)
+    if not info['complete']: raise UploadRejected(f"Upload incomplete ({info['offset']} of {info['size']} bytes).", 409)
+    part_path, info_path = _resumable_paths(folder, upload_id)
+    validator = PdfUploadValidator(info['size'])
+    with open(part_path, 'rb') as part:
+        for block in iter(lambda: part.read(block_size), b''): validator.update(block)
+    digest, size = validator.finish()
+    os.replace(part_path, dest_path)
+    remove_quietly(info_path)
+    return digest, size
+
+def cancel_resumable_upload(folder, upload_id):
+    for path in _resumable_paths(folder, upload_id): remove_quietly(path)